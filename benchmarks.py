@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import time
+import inspect
+import subprocess
+import tempfile
+import tracemalloc
+import pandas as pd
+from logger import ghetto_logger
+from fake_smartsheet import fake_workload
+from conductorv2_wlogger import ConductorV2
+
+class quiet_log:
+    '''stand-in for ghetto_logger so benchmarks dont write to the log file'''
+    def log(self, text, type="new_line", mode="a"):
+        pass
+
+def synthetic_conductor(row_count, sheet_count=50):
+    '''a Conductor DataFrame of row_count resolved rows spread over sheet_count source and destination sheets'''
+    return pd.DataFrame([{
+        'ROW_ID': str(index + 1),
+        'CONDUCTOR_rowid': str(1000000 + index),
+        'WEBHOOK_ID': None,
+        'ENABLED': True,
+        'DESCRIPTION': '',
+        'SOURCE_sheet_name': f'source {index % sheet_count}',
+        'SOURCE_sheet_id': str(5000000 + index % sheet_count),
+        'SOURCE_column_name': f'column {index % 7}',
+        'SOURCE_column_id': str(7000000 + index % 7),
+        'DESTINATION_sheet_id': str(6000000 + (index * 7) % sheet_count),
+        'DESTINATION_column_name': f'dropdown {index}',
+        'DESTINATION_column_id': str(8000000 + index),
+        'DESTINATION_dropdown_type': 'picklist',
+        'PYTHON_MESSAGE': None,
+        'id': 1000000 + index
+    } for index in range(row_count)])
+
+def offline_conductor(conductor_df):
+    '''a ConductorV2 built around an already fetched Conductor DataFrame, without calling __init__ (so nothing touches the api)'''
+    con = ConductorV2.__new__(ConductorV2)
+    con.config = {}
+    con.conductor = conductor_df
+    con.log = quiet_log()
+    con.start_time = time.time()
+    return con
+
+def bench_planning(sizes=(250, 500, 1000, 2000, 4000, 8000)):
+    '''times the planning steps (generate_conductor_dict, filterin_focused_rows, auditdata_transformation) as the Conductor grows,
+    seconds per row should stay flat if planning is linear'''
+    print(f"{'rows':>8} {'seconds':>10} {'us/row':>10}")
+    for size in sizes:
+        con = offline_conductor(synthetic_conductor(size))
+        start = time.perf_counter()
+        row_list = con.generate_conductor_dict()
+        focused = con.filterin_focused_rows(row_list, [row.get("CONDUCTOR_rowid") for row in row_list[::2]])
+        con.auditdata_transformation(focused)
+        con.auditdata_transformation(row_list)
+        seconds = time.perf_counter() - start
+        print(f"{size:>8} {seconds:>10.4f} {seconds / size * 1e6:>10.1f}")
+
+class stack_logger(ghetto_logger):
+    '''the previous ghetto_logger.log (inspect.stack() and a file open per line), kept as the baseline for bench_logger'''
+    def log(self, text, type = "new_line", mode="a"):
+        function_name = inspect.currentframe().f_back.f_code.co_name
+        try:
+            module_name = inspect.getmodule(inspect.stack()[1][0]).__name__
+        except:
+            module_name = "__main__"
+        func_stamp = f"{module_name}.{function_name}(): "
+        with open(self.path, mode=mode) as file:
+            if self.first_use == True:
+                file.write("\n" + "\n"+ self.first_line_stamp)
+                self.first_use = False
+            if self.first_use == False and type == "paragraph":
+                file.write(text)
+            elif self.first_use == False:
+                file.write("\n  " + func_stamp + text)
+
+def bench_logger(lines=20000):
+    '''times lines log calls w/ the old and the new ghetto_logger into a temp file, and checks they wrote the same thing'''
+    print(f"{'logger':>14} {'seconds':>10} {'us/line':>10}")
+    written = {}
+    for logger_class in [stack_logger, ghetto_logger]:
+        with tempfile.TemporaryDirectory() as directory:
+            log = logger_class("benchmarks.py")
+            log.path = os.path.join(directory, "av_logger.txt")
+            start = time.perf_counter()
+            for line in range(lines):
+                log.log(f"updating row {line}")
+            log.flush()
+            seconds = time.perf_counter() - start
+            log.close()
+            with open(log.path) as file:
+                # everything after the first line stamp (its time differs between the two)
+                written[logger_class.__name__] = file.read().split("--", 1)[1]
+        print(f"{logger_class.__name__:>14} {seconds:>10.4f} {seconds / lines * 1e6:>10.1f}")
+    print(f"same output: {written['stack_logger'] == written['ghetto_logger']}")
+
+def bench_run(conductor_rows, run="cron_run", config=None, **workload):
+    '''builds a fake_workload, runs cron_run (or focused_run on every other row) against it and returns wall time, api calls per endpoint and peak allocation'''
+    client, conductor_sheet_id = fake_workload(conductor_rows, **workload)
+    run_config = {'stoken':'fake', 'conductor_sheet_id':conductor_sheet_id, 'smart_client':client, 'requests_per_minute':10 ** 9}
+    run_config.update(config or {})
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    con = ConductorV2(run_config)
+    con.log = quiet_log()
+    if run == "focused_run":
+        con.focused_run([row.get("CONDUCTOR_rowid") for row in con.generate_conductor_dict()[::2]])
+    else:
+        con.cron_run()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"rows":conductor_rows, "run":run, "seconds":seconds, "api_calls":dict(client.counts), "peak_bytes":peak, "report":con.metrics.report()}
+
+def bench_runs(sizes=(25, 100, 400), runs=("cron_run", "focused_run"), config=None, **workload):
+    '''bench_run over Conductor sizes, i.e. bench_runs(config={"max_workers":8}, latency=0.05) to see how the thread pool hides latency'''
+    print(f"{'rows':>6} {'run':>12} {'seconds':>9} {'calls':>7} {'peak MB':>8}  calls per endpoint")
+    results = []
+    for size in sizes:
+        for run in runs:
+            result = bench_run(size, run, config, **workload)
+            results.append(result)
+            calls = ", ".join(f"{endpoint} {count}" for endpoint, count in sorted(result["api_calls"].items()))
+            print(f"{size:>6} {run:>12} {result['seconds']:>9.3f} {sum(result['api_calls'].values()):>7} {result['peak_bytes'] / 1024 / 1024:>8.1f}  {calls}")
+    return results
+
+# import conductorv2_wlogger + ConductorV2(config), what a webhook handler or focused run pays before its first api call
+startup_script = '''
+import sys, json, time
+start = time.perf_counter()
+from conductorv2_wlogger import ConductorV2
+imported = time.perf_counter()
+con = ConductorV2({"stoken":"startup", "conductor_sheet_id":0})
+constructed = time.perf_counter()
+print(json.dumps({"import":imported - start, "init":constructed - imported, "heavy_modules":[name for name in ["pandas", "smartsheet", "requests"] if name in sys.modules],
+    "loaded":[name for name in ["smart", "conductor"] if name in con.__dict__]}))
+'''
+
+def bench_startup(budget_seconds=0.25, repeat=5):
+    '''times importing conductorv2_wlogger and constructing a ConductorV2 in a fresh interpreter (best of repeat) against budget_seconds,
+    and checks neither imported pandas/the smartsheet sdk or made the client or loaded the Conductor'''
+    results = []
+    for attempt in range(repeat):
+        output = subprocess.run([sys.executable, "-c", startup_script], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output))
+    best = min(results, key=lambda result: result["import"] + result["init"])
+    seconds = best["import"] + best["init"]
+    print(f"startup: import {best['import']:.3f}s + init {best['init']:.4f}s = {seconds:.3f}s (budget {budget_seconds}s, {'ok' if seconds <= budget_seconds else 'OVER'})")
+    print(f"heavy modules imported: {best['heavy_modules'] or 'none'}, loaded at init: {best['loaded'] or 'nothing'}")
+    return dict(best, seconds=seconds, within_budget=seconds <= budget_seconds and not best["heavy_modules"] and not best["loaded"])
+
+if __name__ == "__main__":
+    bench_startup()
+    bench_planning()
+    bench_logger()
+    bench_runs()
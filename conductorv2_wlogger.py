@@ -1,40 +1,107 @@
 #region imports
-import smartsheet
-from smartsheet_grid import grid
+# pandas and the smartsheet sdk are imported on first use (see smartsheet_grid), the client and the Conductor sheet are loaded by the first run (see __getattr__)
+from smartsheet_grid import grid, api_call, error_kind, token_bucket
+from sheet_cache import sheet_cache
+from value_index import value_index
+from logger import ghetto_logger
+from run_metrics import run_metrics, merge_reports, write_report, report_summary
+from run_state import run_state
 import time
+import copy
+import json
+import math
+import hashlib
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import pandas as pd
 import os
 import sys
-# Check if we are on a dev computer or server
-if os.name == 'nt':
-    sys.path.append(r"Z:\Shared\IT\Projects and Solutions\Python\Ariel\_Master")
-else:
-    sys.path.append(os.path.expanduser(r"~/_Master"))
 
-# Import master_logger, master_smartsheet_grid, and master_globals
-try:
-    from master_logger import ghetto_logger
-    from master_smartsheet_grid import grid
-    from master_globals import smartsheet_automation_token
-except ImportError as e:
-    print(f"Error importing module: {e}")
-    sys.exit(1)
+def master_token():
+    '''the smartsheet token from master_globals (grid and ghetto_logger come from this repo's smartsheet_grid and logger), only the entry points need it'''
+    # Check if we are on a dev computer or server
+    if os.name == 'nt':
+        sys.path.append(r"Z:\Shared\IT\Projects and Solutions\Python\Ariel\_Master")
+    else:
+        sys.path.append(os.path.expanduser(r"~/_Master"))
+    try:
+        from master_globals import smartsheet_automation_token
+    except ImportError as e:
+        print(f"Error importing module: {e}")
+        sys.exit(1)
+    return smartsheet_automation_token
 #endregion
 
 class ConductorV2:
+    # the destination column type each DESTINATION_dropdown_type posts
+    dropdown_column_types = {'picklist':'PICKLIST', 'multi-picklist':'MULTI_PICKLIST', 'contact':'CONTACT_LIST', 'multi-contact':'MULTI_CONTACT_LIST'}
     def __init__(self, config):
         self.config=config
-        self.smart = smartsheet.Smartsheet(self.config.get("stoken"))
-        self.smart.errors_as_exceptions(True)
+        self.max_workers = self.config.get("max_workers", 1)
         grid.token=self.config.get("stoken")
+        # one client (and keep-alive connection pool) for the whole run, shared with every grid (made on first use, see __getattr__). config "smart_client" swaps in another client
+        grid.client = self.config.get("smart_client")
+        if grid.client != None:
+            self.smart = grid.client
+        # config "shard_index"/"shard_count": cron_run only works the rows whose destination sheet falls in this shard (see shard_rows, sharded_cron_run).
+        # the shards share one token's rate limit, so each gets its share of requests_per_minute
+        self.shard_count = max(1, int(self.config.get("shard_count") or 1))
+        self.shard_index = int(self.config.get("shard_index") or 0)
+        grid.limiter = token_bucket(self.config.get("requests_per_minute", 300) / self.shard_count)
+        grid.measure_memory = bool(self.config.get("measure_memory"))
+        grid.max_retries = self.config.get("max_retries", grid.max_retries)
+        grid.retry_counts = {}
+        # grid.cache is class level, so it is always set (a ConductorV2 w/o cache_dir must not keep using an earlier one's cache)
+        grid.cache = sheet_cache(self.config.get("cache_dir"), self.config.get("cache_max_bytes", 500 * 1024 * 1024)) if self.config.get("cache_dir") else None
+        self.value_index = None
+        if self.config.get("incremental_values"):
+            self.value_index = value_index(self.config.get("cache_dir", "cache"), self.config.get("index_full_refresh_hours", 24), self.config.get("stream_page_size") or 5000)
         self.conductor_sheet_id = config.get("conductor_sheet_id")
-        self.log=ghetto_logger("conductorv2_wlogger.py")
-        self.sheet_id_to_full_dict = lambda sheet_id: self.smart.Sheets.get_columns(sheet_id,level=2).to_dict()
-        self.conductor_sheet_df, self.conductor = self.fetch_df(self.conductor_sheet_id)
+        self.log=ghetto_logger("conductorv2_wlogger.py" if self.shard_count == 1 else f"conductorv2_wlogger.py shard {self.shard_index + 1}/{self.shard_count}")
+        self.sheet_id_to_full_dict = lambda sheet_id: api_call("get_columns", self.smart.Sheets.get_columns, sheet_id, level=2).to_dict()
         self.start_time = time.time()
-        self.gather_column_ids()
+        self.write_batch_size = self.config.get("write_batch_size", 400)
+        self.pending_writes = {}
+        self.write_lock = threading.Lock()
+        self.fetch_savings = {}
+        self.write_stats = {"queued":0, "cells":0, "calls":0}
+        # config "dry_run": runs only build the plan (see plan_run), nothing is written to Smartsheet
+        self.dry_run = bool(self.config.get("dry_run"))
+        self.metrics = run_metrics("init")
+        grid.metrics = self.metrics
+        # config "state_path": cron_run skips the rows that have not changed since they were last posted (see run_state)
+        self.state = None
+        if self.config.get("state_path"):
+            self.state = run_state(self.shard_path(self.config.get("state_path")), self.config.get("state_full_refresh_hours", 24))
+        self.source_versions = {}
+        self.value_bundles = {}
+        self.value_bundle_lock = threading.Lock()
+        self.value_bundle_stats = {"computed":0, "reused":0}
+        self.row_bundles = {}
+        # row id: the audit error queued for that row's PYTHON_MESSAGE this run (see audit_error)
+        self.audit_errors = {}
+    def __getattr__(self, name):
+        '''only called for attributes that are not set yet: the client is made on first use, and the Conductor sheet (conductor, conductor_sheet_df
+        and the columnid_ attributes) is loaded by the first run that reads it. so constructing a ConductorV2 makes no api calls'''
+        if name.startswith("__") or "config" not in self.__dict__:
+            raise AttributeError(f"'ConductorV2' object has no attribute '{name}'")
+        if name == "smart":
+            self.smart = grid.shared_client(self.config.get("stoken"), pool_size=max(8, self.max_workers))
+            grid.client = self.smart
+            return self.smart
+        if name in ["conductor", "conductor_sheet_df"] or name.startswith("columnid_"):
+            if "conductor" not in self.__dict__:
+                self.load_conductor()
+            if name in self.__dict__:
+                return self.__dict__[name]
+        raise AttributeError(f"'ConductorV2' object has no attribute '{name}'")
     # region data gather/preprocessing
+    def load_conductor(self):
+        '''(re)fetches the Conductor sheet and its column ids, the first run does this on its own, long running callers (webhook_receiver) call this before each run'''
+        grid.client = self.smart
+        self.conductor_sheet_df, self.conductor = self.fetch_df(self.conductor_sheet_id)
+        self.gather_column_ids()
     def fetch_df(self, sheet_id):
         '''fetches data from smartsheet, and returns row data'''
         df=grid(sheet_id)
@@ -61,10 +128,57 @@ class ConductorV2:
             self.columnid_PYTHON_MESSAGE = cdf.loc[cdf['title'] == "PYTHON_MESSAGE"]['id'].tolist()[0]
         except IndexError:
             self.log.log("failed to find column_ids, check that the column names have not changed and try again")
-    def fetch_sheet_grid_obj(self, sheet_id):
+    def fetch_sheet_grid_obj(self, sheet_id, source_rows=None, columns_only=False):
+        '''fetches the sheet. for source sheets only the columns that source_rows read are downloaded, and if any contact rows
+        use it the raw cells of their columns are kept (objectValue) for extract_column_info_dict. columns_only skips the rows entirely (destinations only need column_df)'''
         df=grid(sheet_id)
-        df.fetch_content()
+        if columns_only:
+            df.fetch_columns()
+            if self.config.get("measure_fetch_savings"):
+                self.log_fetch_savings(df)
+            return df
+        if source_rows == None:
+            df.fetch_content()
+            return df
+        if self.value_index != None or self.config.get("stream_page_size"):
+            # values come from the value index (which fetches its own changed rows) or a paged read per row (stream_dropdown_values), the audit only needs column_df
+            df.fetch_columns()
+            return df
+        column_ids = self.source_column_ids(df.column_index, source_rows)
+        contact_column_ids = self.source_column_ids(df.column_index, source_rows, ['contact', 'multi-contact'])
+        if not column_ids:
+            # none of the rows' columns exist on the sheet, the row audits will log that
+            df.fetch_columns()
+        elif contact_column_ids:
+            df.fetch_content(level=2, include="objectValue", cell_column_ids=contact_column_ids, column_ids=column_ids)
+        else:
+            df.fetch_content(column_ids=column_ids)
+        if grid.measure_memory and "fetch_stats" in df.__dict__:
+            self.log_fetch_stats(df)
         return df
+    def log_fetch_stats(self, sheet):
+        '''logs the size and peak allocation of a source sheet fetch (config "measure_memory"), peaks overlap when max_workers > 1'''
+        stats = sheet.fetch_stats
+        max_rss = f', max rss {round(stats["max_rss_kb"] / 1024, 1)}MB' if stats.get("max_rss_kb") != None else ""
+        self.log.log(f'fetched {stats["sheet_id"]} ({stats["rows"]} rows x {stats["columns"]} columns) in {stats["seconds"]}s, peak {round(stats["peak_bytes"] / 1024 / 1024, 1)}MB allocated{max_rss}')
+    def log_fetch_savings(self, sheet):
+        '''logs how much a column only fetch saved on this sheet (turned on w/ config "measure_fetch_savings", it costs an extra full fetch)'''
+        savings = sheet.measure_fetch_savings()
+        self.fetch_savings[sheet.grid_id] = savings
+        self.log.log(f'column only fetch of {sheet.grid_id} ({savings["rows"]} rows) saved {savings["bytes_saved"]} bytes and {savings["seconds_saved"]}s')
+    def source_column_ids(self, column_index, row_list, dropdown_types=None):
+        '''finds the SOURCE column ids that the rows will read (by id if posted, and by name incase the id is stale), optionally just for some dropdown types'''
+        column_ids = set()
+        for row in row_list:
+            if dropdown_types == None or row.get("DESTINATION_dropdown_type") in dropdown_types:
+                try:
+                    if int(row.get("SOURCE_column_id")) in column_index["by_id"]:
+                        column_ids.add(int(row.get("SOURCE_column_id")))
+                except (TypeError, ValueError):
+                    pass
+                if row.get("SOURCE_column_name") in column_index["by_title"]:
+                    column_ids.add(column_index["by_title"][row.get("SOURCE_column_name")])
+        return sorted(column_ids)
     def timestamp(self): 
         '''creates a string of minute/second from start_time until now for logging'''
         end_time = time.time()  # get the end time of the program
@@ -74,45 +188,116 @@ class ConductorV2:
         timestamp = "{:02d}:{:02d}".format(int(minutes), int(seconds))
         
         return timestamp
-    def ss_log(self, row_id, message_string, with_print=True):
-        '''logs error/success message to log column in Conductor sheet on Smartsheet'''
-        new_cell = self.smart.models.Cell()
-        new_cell.column_id = self.columnid_PYTHON_MESSAGE
-        new_cell.value = message_string
-        new_cell.strict = False
-        
-        new_row = self.smart.models.Row()
-        new_row.id =  int(row_id)
-        new_row.cells.append(new_cell)
+    def run_workers(self, func, items):
+        '''calls func on each item, on a pool of config "max_workers" threads when that is more than 1 (the api calls all share grid.limiter)'''
+        if self.max_workers <= 1:
+            for item in items:
+                func(item)
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                list(pool.map(func, items))
+    def row_worker(self):
+        '''shallow copy of the conductor for working one row, so the per row attributes (inputs, contact_list, etc...) dont collide between threads
+        while the client, log and write buffer stay shared'''
+        return copy.copy(self)
+    def queue_write(self, row_id, column_id, value, count=True):
+        '''queues a cell write to the Conductor sheet, later writes to the same cell replace earlier ones (see flush_writes).
+        count=False for writes already counted when they were first queued (a plan's conductor_writes)'''
+        with self.write_lock:
+            self.pending_writes.pop((int(row_id), column_id), None)
+            self.pending_writes[(int(row_id), column_id)] = value
+            if count:
+                self.write_stats["queued"] += 1
+    def flush_writes(self, phase=""):
+        '''posts every queued cell write to the Conductor sheet as chunked bulk update_rows calls'''
+        if self.dry_run:
+            if self.pending_writes:
+                self.log.log(f"{self.timestamp()} dry run, {len(self.pending_writes)} {phase} cell writes not flushed")
+            return
+        with self.write_lock:
+            pending_writes = self.pending_writes
+            self.pending_writes = {}
+        if not pending_writes:
+            return
+        row_cells = {}
+        for (row_id, column_id), value in pending_writes.items():
+            new_cell = self.smart.models.Cell()
+            new_cell.column_id = column_id
+            new_cell.value = value
+            new_cell.strict = False
+            row_cells.setdefault(row_id, []).append(new_cell)
+        cell_count = len(pending_writes)
 
-        self.smart.Sheets.update_rows(self.conductor_sheet_id, [new_row])
+        new_rows = []
+        for row_id, cells in row_cells.items():
+            new_row = self.smart.models.Row()
+            new_row.id = row_id
+            for new_cell in cells:
+                new_row.cells.append(new_cell)
+            new_rows.append(new_row)
+
+        calls = 0
+        for start in range(0, len(new_rows), self.write_batch_size):
+            chunk = new_rows[start:start + self.write_batch_size]
+            try:
+                api_call("update_rows", self.smart.Sheets.update_rows, self.conductor_sheet_id, chunk)
+                calls += 1
+            except Exception as error:
+                if error_kind(error) in ["throttled", "transient"]:
+                    # posting row by row would only multiply the calls, the unwritten cells go back in the buffer for the next flush
+                    left = {row.id for row in new_rows[start:]}
+                    with self.write_lock:
+                        for key, value in pending_writes.items():
+                            if key[0] in left:
+                                self.pending_writes.setdefault(key, value)
+                    cell_count -= sum(1 for key in pending_writes if key[0] in left)
+                    self.log.log(f"update_rows still {error_kind(error)} after retries, {len(left)} rows left for the next flush")
+                    break
+                # one bad row (i.e. deleted since the fetch) fails the whole chunk, so fall back to posting row by row
+                self.log.log(f"bulk update_rows failed, posting {len(chunk)} rows individually")
+                for new_row in chunk:
+                    try:
+                        api_call("update_rows", self.smart.Sheets.update_rows, self.conductor_sheet_id, [new_row])
+                    except:
+                        self.log.log(f"failed to post to row {new_row.id}")
+                    calls += 1
+        self.write_stats["cells"] += cell_count
+        self.write_stats["calls"] += calls
+        self.log.log(f"{self.timestamp()} flushed {cell_count} {phase} cell writes in {calls} update_rows call(s)")
+    def log_write_savings(self):
+        '''logs how many api calls the write buffer saved compared to one update_rows call per write'''
+        saved = self.write_stats["queued"] - self.write_stats["calls"]
+        self.log.log(f'{self.timestamp()} batched {self.write_stats["queued"]} writes ({self.write_stats["cells"]} cells) into {self.write_stats["calls"]} update_rows call(s), saved {saved} api calls')
+    def log_cache_stats(self):
+        '''logs how many sheet fetches the on disk cache (config "cache_dir") saved'''
+        if grid.cache != None:
+            self.log.log(f'{self.timestamp()} sheet cache: {grid.cache.hits} fetches reused, {grid.cache.misses} downloaded')
+    def log_retry_stats(self):
+        '''logs the retries api_call made per endpoint, and the calls it gave up on (those rows are left for the next run)'''
+        for endpoint, counts in grid.retry_counts.items():
+            self.log.log(f'{self.timestamp()} {endpoint} retries: ' + ', '.join(f'{count} {kind}' for kind, count in counts.items()))
+    def ss_log(self, row_id, message_string, with_print=True):
+        '''logs error/success message to log column in Conductor sheet on Smartsheet (queued until the next flush_writes)'''
+        self.queue_write(row_id, self.columnid_PYTHON_MESSAGE, message_string)
         if with_print:
-            self.log.log(f"Logged: {message_string}")
+            self.log.log(f"Logged to {row_id}: {message_string}")
     def ss_post(self, column_id, column_name, row_id, post_value, with_log=True, with_print=False):
         '''same as log, but lets you post to any column. This function exists for posting data, where log exists for logging messages from code'''
-        new_cell = self.smart.models.Cell()
-        new_cell.column_id = column_id
-        new_cell.value = post_value
-        new_cell.strict = False
-        
-        new_row = self.smart.models.Row()
-        new_row.id =  int(row_id)
-        new_row.cells.append(new_cell)
-
-        self.smart.Sheets.update_rows(self.conductor_sheet_id, [new_row])
+        self.queue_write(row_id, column_id, post_value)
         message = f"Posted to {column_name}: {post_value}"
         if with_print:
             self.log.log(message)
-        if with_log:
+        # an informational message would replace the row's audit error in the write buffer (last write wins)
+        if with_log and str(row_id) not in self.audit_errors:
             self.ss_log(row_id, message, with_print)
+    def audit_error(self, row_id, message_string):
+        '''ss_log for audit errors, remembered so later informational messages dont replace them and a skipped row can log it again'''
+        self.audit_errors[str(row_id)] = message_string
+        self.ss_log(row_id, message_string)
     def filterin_focused_rows(self, row_list, input_rowid_list):
         '''shortens the row list to just rows that have a row id matching the rowid list used to run a "focused run" and only run certain rows'''
-        focused_row_list = []
-        for row in row_list:
-            for id in input_rowid_list:
-                if str(row.get("CONDUCTOR_rowid"))==str(id):
-                    focused_row_list.append(row)
-        return focused_row_list
+        focused_rowids = {str(id) for id in input_rowid_list}
+        return [row for row in row_list if str(row.get("CONDUCTOR_rowid")) in focused_rowids]
     def source_column_id(self, row_index):
         '''either returns a column_id if it's already there, or returns None'''
         if self.conductor['SOURCE_column_id'][row_index] != "":
@@ -127,6 +312,21 @@ class ConductorV2:
         else:
             DESTINATION_column_id = None
         return DESTINATION_column_id
+    def shard_path(self, path):
+        '''path as is, or <path>.shard<i>of<n> in a shard, so shards dont overwrite each other's state/plan files'''
+        return path if self.shard_count == 1 else f'{path}.shard{self.shard_index}of{self.shard_count}'
+    def shard_of(self, sheet_id):
+        '''the shard a destination sheet belongs to, a hash of the id (not its position) so every process and host agrees w/o talking to each other'''
+        return zlib.crc32(str(sheet_id).strip().encode()) % self.shard_count
+    def shard_rows(self, row_list):
+        '''the rows of this shard (config "shard_index" of "shard_count"), every row of a destination sheet lands in the same shard so no two shards post to one sheet.
+        the CONDUCTOR_rowid writes generate_conductor_dict queued for the other shards' rows are dropped, those shards write them'''
+        rows = [row for row in row_list if self.shard_of(row.get("DESTINATION_sheet_id")) == self.shard_index]
+        row_ids = {int(row.get("CONDUCTOR_rowid")) for row in rows}
+        with self.write_lock:
+            self.pending_writes = {key:value for key, value in self.pending_writes.items() if key[0] in row_ids}
+        self.log.log(f'{self.timestamp()} shard {self.shard_index + 1} of {self.shard_count}: {len(rows)} of {len(row_list)} rows')
+        return rows
     def conductor_row_id(self, row_index):
         '''checks to see if the row id is posted, and if not posts it'''
         if self.conductor['CONDUCTOR_rowid'][row_index] == None:
@@ -139,99 +339,101 @@ class ConductorV2:
         '''makes dict object with all data needed for rest of script'''
         self.log.log(f'{self.timestamp()} gathering data...')
         row_objects = []
-        for row_index in range(len(self.conductor['id'].tolist())):
-            if self.conductor['SOURCE_sheet_id'][row_index] != None and not("header" in self.conductor['SOURCE_sheet_id'][row_index]):
+        # dedupes on every value of the row dict (a set of keys instead of comparing against every earlier row)
+        seen_rows = set()
+        for row_index, conductor_row in enumerate(self.conductor.to_dict("records")):
+            if conductor_row['SOURCE_sheet_id'] != None and not("header" in conductor_row['SOURCE_sheet_id']):
             # if the sheet_id is blank, it will not work anyways (and we are likely working with an enabled row or roll up header)
                 row_dict ={
                     'CONDUCTOR_rowid' : self.conductor_row_id(row_index),
-                    'ROW_ID' : self.conductor['ROW_ID'][row_index],
-                    'ENABLED': self.conductor['ENABLED'][row_index],
-                    'SOURCE_sheet_name':self.conductor['SOURCE_sheet_name'][row_index],
-                    'SOURCE_sheet_id': self.conductor['SOURCE_sheet_id'][row_index],
-                    'SOURCE_column_name':self.conductor['SOURCE_column_name'][row_index],
+                    'ROW_ID' : conductor_row['ROW_ID'],
+                    'WEBHOOK_ID' : conductor_row['WEBHOOK_ID'],
+                    'ENABLED': conductor_row['ENABLED'],
+                    'SOURCE_sheet_name':conductor_row['SOURCE_sheet_name'],
+                    'SOURCE_sheet_id': conductor_row['SOURCE_sheet_id'],
+                    'SOURCE_column_name':conductor_row['SOURCE_column_name'],
                     'SOURCE_column_id': self.source_column_id(row_index),
-                    'DESTINATION_sheet_id':self.conductor['DESTINATION_sheet_id'][row_index],
-                    'DESTINATION_column_name':self.conductor['DESTINATION_column_name'][row_index],
+                    'DESTINATION_sheet_id':conductor_row['DESTINATION_sheet_id'],
+                    'DESTINATION_column_name':conductor_row['DESTINATION_column_name'],
                     'DESTINATION_column_id':self.destination_column_id(row_index),
-                    'DESTINATION_dropdown_type':self.conductor['DESTINATION_dropdown_type'][row_index],
+                    'DESTINATION_dropdown_type':conductor_row['DESTINATION_dropdown_type'],
                     'index':row_index
                     }
-                if row_dict not in row_objects:
+                row_key = tuple(row_dict.items())
+                if row_key not in seen_rows:
+                    seen_rows.add(row_key)
                     row_objects.append(row_dict)
 
         return row_objects
     # endregion
     # region auditing (data = self.row_list)
     def auditdata_transformation(self, row_data):
-        '''reorganizes the data by sheet id to improve code's efficancy. This way, it only uses the api (to pull sheet data) once per sheet in use'''
-        source_sheet_id_list = []
-        source_audit_list = []
-
-        destination_sheet_id_list = []
-        destination_audit_list = []
+        '''reorganizes the data by sheet id to improve code's efficancy. This way, it only uses the api (to pull sheet data) once per sheet in use.
+        returns two dicts of sheet_id: [rows using that sheet], for SOURCE and DESTINATION'''
+        source_audit = {}
+        destination_audit = {}
         for row in row_data:
-            # source
-            if row.get('SOURCE_sheet_id') not in source_sheet_id_list:
-                source_sheet_id_list.append(row.get('SOURCE_sheet_id'))
-                source_audit_list.append({row.get('SOURCE_sheet_id'):[row]})
-            else:
-                for sheet_id in source_audit_list:
-                    if list(sheet_id.keys())[0] == row.get('SOURCE_sheet_id'):
-                        sheet_id[row.get('SOURCE_sheet_id')].append(row)
-            
-            #destination
-            if row.get('DESTINATION_sheet_id') not in destination_sheet_id_list:
-                destination_sheet_id_list.append(row.get('DESTINATION_sheet_id'))
-                destination_audit_list.append({row.get('DESTINATION_sheet_id'):[row]})
-            else:
-                for sheet_id in destination_audit_list:
-                    if list(sheet_id.keys())[0] == row.get('DESTINATION_sheet_id'):
-                        sheet_id[row.get('DESTINATION_sheet_id')].append(row)
-        return source_audit_list, destination_audit_list
+            source_audit.setdefault(row.get('SOURCE_sheet_id'), []).append(row)
+            destination_audit.setdefault(row.get('DESTINATION_sheet_id'), []).append(row)
+        return source_audit, destination_audit
     def ssdata_audit(self, row_list, location_str):
         '''audits the raw row_data by looping through it looking for possible errors (missing source id, wrong column types, etc...)
-        location str specificies SOURCE or DESTINATION'''
+        row_list is a sheet_id: [rows] dict from auditdata_transformation, location str specificies SOURCE or DESTINATION'''
         self.log.log(f'{self.timestamp()} auditing {location_str.lower()} data...')
-        for row_cluster in row_list:
-                try:
-                    sheet_id = list(row_cluster.keys())[0]
-                    df, sheet = self.audit_sheet_id(sheet_id, row_cluster, location_str)
-                except TypeError:
-                    self.log.log("cluster skipped")
-                for row in row_cluster.get(sheet_id):
-                    try:
-                        row[f'{location_str}_grid_obj']=sheet
-                        if row.get(f'{location_str}_column_id') == None:
-                            self.fetch_columnid_w_columname(row, df, location_str)
-                        self.audit_columntitle_against_columnid(row, df, location_str)
-                        self.find_column_index(row, df, location_str)
-                    except:
-                        self.log.log('row skipped')
+        self.run_workers(lambda row_cluster: self.audit_cluster(row_cluster[0], row_cluster[1], location_str), list(row_list.items()))
+    def audit_cluster(self, sheet_id, row_cluster, location_str):
+        '''fetches one sheet and audits every row that uses it (one unit of work for run_workers)'''
+        start = time.perf_counter()
+        try:
+            columns, sheet = self.audit_sheet_id(sheet_id, row_cluster, location_str)
+        except TypeError:
+            self.metrics.record_sheet(sheet_id, location_str, time.perf_counter() - start, len(row_cluster), False)
+            self.log.log(f"cluster {sheet_id} skipped")
+            return
+        self.metrics.record_sheet(sheet_id, location_str, time.perf_counter() - start, len(row_cluster), True)
+        for row in row_cluster:
+            try:
+                row[f'{location_str}_grid_obj']=sheet
+                if row.get(f'{location_str}_column_id') == None:
+                    self.fetch_columnid_w_columname(row, columns, location_str)
+                self.audit_columntitle_against_columnid(row, columns, location_str)
+                self.find_column_index(row, columns, location_str)
+            except:
+                self.log.log(f'row {row.get("ROW_ID")} skipped')
     def audit_sheet_id(self, sheet_id, row_cluster, location_str):
         '''tries to fetch the data for the sheet, and if it fails, logs the error message'''
         try:
-            sheet = self.fetch_sheet_grid_obj(sheet_id)
-            df = sheet.column_df
-            return df, sheet
-        except:
-            for row in row_cluster.get(sheet_id):
-                self.ss_log(row['CONDUCTOR_rowid'], f"{location_str} SHEET ID ERROR: Sheet ID not found, check that the ID is right, and shared w/ automation@dowbuilt.com")
+            if location_str == "SOURCE":
+                sheet = self.fetch_sheet_grid_obj(sheet_id, row_cluster)
+            else:
+                sheet = self.fetch_sheet_grid_obj(sheet_id, columns_only=True)
+            return sheet.column_index, sheet
+        except Exception as error:
+            kind = error_kind(error)
+            if kind in ["throttled", "transient"]:
+                # not the row's fault, leave PYTHON_MESSAGE alone and let the next run pick the rows up
+                self.log.log(f"{location_str} sheet {sheet_id} still {kind} after retries, {len(row_cluster)} row(s) left for the next run")
+                return
+            for row in row_cluster:
+                if kind == "not_found":
+                    self.audit_error(row['CONDUCTOR_rowid'], f"{location_str} SHEET ID ERROR: Sheet ID not found, check that the ID is right, and shared w/ automation@dowbuilt.com")
+                else:
+                    self.audit_error(row['CONDUCTOR_rowid'], f"{location_str} SHEET ID ERROR: could not read the sheet ({type(error).__name__}: {error})")
             return 
-    def fetch_columnid_w_columname(self, row, df, location_str):
-        '''fetches the column id using the column name for a row'''
+    def fetch_columnid_w_columname(self, row, columns, location_str):
+        '''fetches the column id using the column name for a row (columns is the sheet's grid.column_index)'''
         if location_str == "SOURCE":
             posting_column_id = self.columnid_SOURCE_column_id
         else:
             posting_column_id = self.columnid_DESTINATION_column_id
         
         try:
-            column_data = df[df['title'] == row.get(f'{location_str}_column_name')]
-            column_id = column_data['id'].tolist()[0]
+            column_id = columns["by_title"][row.get(f'{location_str}_column_name')]
             row[f'{location_str}_column_id'] = column_id 
             self.ss_post(posting_column_id, f"{location_str}_column_id", row['CONDUCTOR_rowid'], row[f'{location_str}_column_id'])
-        except IndexError:
-            self.ss_log(row['CONDUCTOR_rowid'], f"{location_str} COLUMN NAME ERROR: Column Name not found on {location_str} sheet (with given sheet id)")
-    def audit_columntitle_against_columnid(self, row, df, location_str):
+        except KeyError:
+            self.audit_error(row['CONDUCTOR_rowid'], f"{location_str} COLUMN NAME ERROR: Column Name not found on {location_str} sheet (with given sheet id)")
+    def audit_columntitle_against_columnid(self, row, columns, location_str):
         '''looks at the Source Column on its native sheet, and checks the name of the column that corresponds with the column_id on the row. If there is a discrepency the column_name changes'''
         if location_str == "SOURCE":
             posting_column_id = self.columnid_SOURCE_column_name
@@ -239,28 +441,32 @@ class ConductorV2:
             posting_column_id = self.columnid_DESTINATION_column_name
         
         try:
-            column_data = df[df['id'] == int(row.get(f'{location_str}_column_id'))]
-            column_name = column_data['title'].tolist()[0]
+            column_name = columns["by_id"][int(row.get(f'{location_str}_column_id'))]['title']
             if column_name != row[f'{location_str}_column_name']:
                 row[f'{location_str}_column_name'] = column_name
                 self.ss_post(posting_column_id, f"{location_str}_column_name", row['CONDUCTOR_rowid'], row[f'{location_str}_column_name'])
-        except IndexError:
-            self.ss_log(row['CONDUCTOR_rowid'], f"{location_str} COLUMN ID ERROR: Column ID not found on {location_str} sheet (with given sheet id)")
-            self.fetch_columnid_w_columname(row, df, location_str)
-    def find_column_index(self, row, df, location_str):
+        except KeyError:
+            self.audit_error(row['CONDUCTOR_rowid'], f"{location_str} COLUMN ID ERROR: Column ID not found on {location_str} sheet (with given sheet id)")
+            self.fetch_columnid_w_columname(row, columns, location_str)
+    def find_column_index(self, row, columns, location_str):
         '''used to update the row when data is large and not in df, data can be located purely by index'''
-        for count, column_name in enumerate(df['title'].tolist()):
-            if column_name == row.get(f'{location_str}_column_name'):
-                row[f'{location_str}_column_index'] = count
+        column_id = columns["by_title"].get(row.get(f'{location_str}_column_name'))
+        if column_id != None:
+            row[f'{location_str}_column_index'] = columns["by_id"][column_id]["position"]
     #endregion
     # region posting dropdowns (data = self.inputs)
         # region value bundling 
     def extract_column_info_dict(self):
-        get_desired_column_data = lambda row: row.get("cells")[self.inputs.get('SOURCE_column_index')] 
-        thorough_sheet_obj = self.smart.Sheets.get_sheet(self.inputs.get("SOURCE_sheet_id"), include="objectValue", level=2).to_dict().get("rows")
-        self.column_content_dict = [get_desired_column_data(row) 
-            for row in 
-            thorough_sheet_obj]
+        '''pulls the source column's raw cells (w/ objectValue) from the sheet copy fetched during the source audit, only downloading that column again if it was not kept'''
+        column_id = int(self.inputs.get('SOURCE_column_id'))
+        source_grid = self.inputs.get('SOURCE_grid_obj')
+        if column_id in source_grid.grid_cells:
+            self.column_content_dict = source_grid.grid_cells.get(column_id)
+        else:
+            thorough_sheet_obj = api_call("get_sheet", self.smart.Sheets.get_sheet, self.inputs.get("SOURCE_sheet_id"), include="objectValue", level=2, column_ids=[column_id]).to_dict().get("rows")
+            self.column_content_dict = [row.get("cells")[0]
+                for row in
+                thorough_sheet_obj]
     def contact_r_multi_data(self, objectValue):
             try: 
                 #for single contact
@@ -269,6 +475,7 @@ class ConductorV2:
                 #for first item of multi contact
                 return [item["objectValue"]["values"][0][objectValue] for item in self.column_content_dict if "objectValue" in item]   
     def extract_name_n_email_list(self):
+        import pandas as pd
         try:
             column_content_object = pd.DataFrame({
                 "email":self.contact_r_multi_data("email"),
@@ -289,9 +496,33 @@ class ConductorV2:
         df = self.inputs.get('SOURCE_grid_obj').df
         values = df[source_column].dropna().unique()
         return sorted(values)
+    def stream_dropdown_values(self):
+        '''value_bundle from a paged read of the SOURCE column (config "stream_page_size" rows per page), only the distinct values are kept between pages.
+        same result as clean_pick_list (sorted distinct values) and extract_name_n_email_list (distinct email/name in sheet order)'''
+        contact = self.inputs.get("DESTINATION_dropdown_type") in ['contact', 'multi-contact']
+        fetch_args = {"level":2, "include":"objectValue"} if contact else {}
+        values = {}
+        for row_id, modified_at, cell in self.inputs.get('SOURCE_grid_obj').iter_column_cells(self.inputs.get('SOURCE_column_id'), self.config.get("stream_page_size"), **fetch_args):
+            if contact:
+                object_value = cell.get("objectValue") or {}
+                if "values" in object_value:
+                    # first item of multi contact
+                    object_value = (object_value.get("values") or [{}])[0]
+                if object_value.get("email"):
+                    values.setdefault((object_value.get("email"), object_value.get("name")), {"email":object_value.get("email"), "name":object_value.get("name")})
+            else:
+                value = cell.get("displayValue") if cell.get("displayValue") != None else cell.get("value")
+                if value != None:
+                    values.setdefault(value, value)
+        return list(values.values()) if contact else sorted(values.values())
     def gather_dropdown_values(self):
         '''gather/clean data that will become the dropdown options in the destinations based on type'''
-        if self.inputs.get("DESTINATION_dropdown_type") in ['picklist','multi-picklist']:
+        if self.value_index != None and self.inputs.get("DESTINATION_dropdown_type") in self.dropdown_column_types:
+            kind = "contact" if self.inputs.get("DESTINATION_dropdown_type") in ['contact', 'multi-contact'] else "picklist"
+            value_bundle = self.value_index.bundle(self.inputs.get('SOURCE_grid_obj'), self.inputs.get('SOURCE_column_id'), kind)
+        elif self.config.get("stream_page_size") and self.inputs.get("DESTINATION_dropdown_type") in self.dropdown_column_types:
+            value_bundle = self.stream_dropdown_values()
+        elif self.inputs.get("DESTINATION_dropdown_type") in ['picklist','multi-picklist']:
             value_bundle = self.clean_pick_list()
         elif self.inputs.get("DESTINATION_dropdown_type") in ['contact', 'multi-contact']:
             self.extract_column_info_dict()
@@ -300,55 +531,72 @@ class ConductorV2:
         else:
             self.ss_log(self.inputs.get('CONDUCTOR_rowid'), "DESTINATION_dropdown_type ERROR: the Dropdown type did not match the required options")
         self.inputs['value_bundle'] = value_bundle
+    def memo_dropdown_values(self):
+        '''gather_dropdown_values once per (source sheet, source column, picklist/contact) per run, rows pushing the same source column into other
+        destinations reuse that value_bundle. rows asking for the same bundle at once wait on the first one instead of extracting it again'''
+        if self.inputs.get("DESTINATION_dropdown_type") not in self.dropdown_column_types:
+            return self.gather_dropdown_values()
+        kind = self.bundle_kind(self.inputs)
+        key = (str(self.inputs.get('SOURCE_sheet_id')), str(self.inputs.get('SOURCE_column_id')), kind)
+        with self.value_bundle_lock:
+            memo = self.value_bundles.setdefault(key, {"lock":threading.Lock()})
+        with memo["lock"]:
+            if "value_bundle" in memo:
+                self.inputs['value_bundle'] = memo["value_bundle"]
+                with self.value_bundle_lock:
+                    self.value_bundle_stats["reused"] += 1
+                return
+            self.gather_dropdown_values()
+            memo["value_bundle"] = self.inputs.get('value_bundle')
+            with self.value_bundle_lock:
+                self.value_bundle_stats["computed"] += 1
+    def log_value_bundle_stats(self):
+        if self.value_bundle_stats["reused"]:
+            self.log.log(f'{self.timestamp()} value bundles: {self.value_bundle_stats["computed"]} extracted, {self.value_bundle_stats["reused"]} reused by rows w/ the same source column')
         # endregion
         # region value posting 
     def picklist_updater(self):
         '''posts if the type is picklist'''
-        self.inputs['column_update'] = self.smart.models.Column({
+        self.inputs['column_props'] = {
             'type': 'PICKLIST',
             'options' : self.inputs.get("value_bundle"),
             'validation' : False,
             'overrideValidation' : True
-        })
+        }
     def multipicklist_updater(self):
         '''posts if the type is multi picklist'''
-        self.inputs['column_update'] = self.smart.models.Column({
+        self.inputs['column_props'] = {
         'type': 'MULTI_PICKLIST',
         'options' :  self.inputs.get("value_bundle"),
         'validation' : False,
         'overrideValidation' : True
-        })
+        }
     def contact_updater(self):
         '''posts if the type is contact'''
-        self.inputs['column_update'] = self.smart.models.Column({
+        self.inputs['column_props'] = {
             'override_validation' : 'True',
             'formula' : "",
-            'type' : "CONTACT",
             'contactOptions' : 
                 self.inputs.get("value_bundle"),
                 'type' : 'CONTACT_LIST'
-        })
+        }
     def multicontact_updater(self):
         '''posts if hte type is multi contact'''
-        self.inputs['column_update']= self.smart.models.Column({
+        self.inputs['column_props'] = {
             'override_validation' : 'True',
             'formula' : "",
-            'type' : "MULTI_CONTACT_LIST",
             'contactOptions' : 
                 self.inputs.get("value_bundle"),
                 'type' : 'MULTI_CONTACT_LIST'
-        })
-    def post_update(self, sheet_id, column_id):
-        # try:
-        self.response = self.smart.Sheets.update_column(
-        sheet_id, 
-        column_id, 
-        self.inputs['column_update']
+        }
+    def post_update(self, sheet_id, column_id, column_props):
+        self.response = api_call("update_column", self.smart.Sheets.update_column,
+        int(sheet_id), 
+        int(column_id), 
+        self.smart.models.Column(column_props)
         )
-        # except:
-        #     self.ss_log(self.inputs.get("CONDUCTOR_rowid"), "Post_Update failed!")
-    def dynamic_column_update(self, sheet_id, column_id):
-        '''checks the column type, and chooses the correct posting function to match the column type'''
+    def build_column_update(self):
+        '''checks the column type, and chooses the correct updater to build the column update (inputs['column_props']), False if the type is unknown'''
         if self.inputs.get("DESTINATION_dropdown_type") == "picklist":
             self.picklist_updater()
         elif self.inputs.get("DESTINATION_dropdown_type") == "multi-picklist":
@@ -359,14 +607,34 @@ class ConductorV2:
             self.multicontact_updater()
         else:
             self.ss_log(self.inputs.get("CONDUCTOR_rowid"), "dyanmic_column_update failed, Check that the column type has no typos.")
-        self.post_update(sheet_id, column_id)  
-    def log_successful_post(self):
+            return False
+        return True
+    def destination_column_unchanged(self):
+        '''compares value_bundle against the options the destination column already has (column_index from the destination audit).
+        picklist options are compared in order (that is the order users see), contacts as a set of email/name. config "force_post" skips this check'''
+        if self.config.get("force_post"):
+            return False
+        column = self.inputs.get('DESTINATION_grid_obj').column_index["by_id"].get(int(self.inputs.get('DESTINATION_column_id')))
+        if column == None:
+            return False
+        if column.get('type') != self.dropdown_column_types.get(self.inputs.get("DESTINATION_dropdown_type")):
+            return False
+        if self.inputs.get("DESTINATION_dropdown_type") in ['picklist','multi-picklist']:
+            if column.get('validation') == True:
+                return False
+            current_options = column.get('options') if isinstance(column.get('options'), list) else []
+            return [str(option) for option in current_options] == [str(value) for value in self.inputs.get('value_bundle')]
+        else:
+            contact_key = lambda contact: (str(contact.get('email', '')).lower(), contact.get('name') or '')
+            current_contacts = column.get('contactOptions') if isinstance(column.get('contactOptions'), list) else []
+            return {contact_key(contact) for contact in current_contacts} == {contact_key(contact) for contact in self.inputs.get('value_bundle')}
+    def log_successful_post(self, status="POSTED", row_id=None):
         '''generates a posting message that says the time/date'''
         now = datetime.now()
         dt_string = now.strftime("%m/%d %H:%M")
-        self.ss_log(self.inputs.get("CONDUCTOR_rowid"), f"{dt_string} POSTED")
+        self.ss_log(row_id or self.inputs.get("CONDUCTOR_rowid"), f"{dt_string} {status}")
         # endregion
-    def update_columns_dynamic_dropdowns(self, row_data):
+    def plan_column_update(self, row_data):
         '''same row_data = {'CONDUCTOR_rowid': '364965002733444',
                             'ENABLED': True,
                             'SOURCE_sheet_name': 'Sheet',
@@ -377,45 +645,405 @@ class ConductorV2:
                             'DESTINATION_dropdown_type': 'picklist',
                             'index': 0,
                             'source_grid_obj': <smartsheet_grid.smartsheet_grid.grid at 0x2bf80ef6350>,
-                            'column_index':3}'''
+                            'column_index':3}
+        works out the row's column update without posting it, returns the plan fields (action "update" w/ the column, "unchanged" or "failed")'''
         self.error_message = False
         self.inputs = row_data
-        self.gather_dropdown_values()
-        self.dynamic_column_update(self.inputs.get("DESTINATION_sheet_id"), self.inputs.get("DESTINATION_column_id"))
-        self.log_successful_post()
+        with self.metrics.phase("value_gathering"):
+            self.memo_dropdown_values()
+        value_bundle = json.loads(json.dumps(self.inputs.get('value_bundle'), default=self.plain_value))
+        self.row_bundles[str(row_data.get("CONDUCTOR_rowid"))] = value_bundle
+        planned = {"value_count":len(value_bundle), "value_hash":hashlib.sha1(json.dumps(value_bundle, sort_keys=True).encode()).hexdigest()}
+        if self.destination_column_unchanged():
+            return dict(planned, action="unchanged")
+        if not self.build_column_update():
+            return dict(planned, action="failed")
+        return dict(planned, action="update", column=json.loads(json.dumps(self.inputs['column_props'], default=self.plain_value)))
+    def merge_key(self, row):
+        '''the destination column a row writes, as (sheet id, column id) after the audit resolved the id'''
+        return (str(row.get("DESTINATION_sheet_id")), str(row.get("DESTINATION_column_id")))
+    def bundle_kind(self, row):
+        '''"contact" or "picklist", the rows of one kind extract (and so can merge) the same kind of value_bundle'''
+        return "contact" if row.get("DESTINATION_dropdown_type") in ['contact', 'multi-contact'] else "picklist"
+    def merge_bundles(self, rows):
+        '''the value_bundle of rows that write one destination column, w/ config "merge_policy": "union" (default) posts every row's values
+        (picklists sorted like clean_pick_list, contacts deduped on email in Conductor order), "priority" posts only the first row's (the highest in the Conductor)'''
+        bundles = [self.row_bundles.get(str(row.get("CONDUCTOR_rowid"))) or [] for row in rows]
+        types = {self.bundle_kind(row) for row in rows}
+        if self.config.get("merge_policy", "union") == "priority" or len(types) > 1:
+            return bundles[0]
+        if types == {"contact"}:
+            contacts = {}
+            for bundle in bundles:
+                for contact in bundle:
+                    contacts.setdefault(str(contact.get("email", "")).lower(), contact)
+            return list(contacts.values())
+        values = list(dict.fromkeys(value for bundle in bundles for value in bundle))
+        try:
+            return sorted(values)
+        except TypeError:
+            return sorted(values, key=str)
+    def coalesce_entries(self, entries, row_list):
+        '''one update_column per destination column: rows writing the same column are merged into the first of them (see merge_bundles),
+        which is re-planned w/ the merged values, the others get action "merged" and their PYTHON_MESSAGE when the first one is applied'''
+        rows = {str(row.get("CONDUCTOR_rowid")):row for row in row_list}
+        groups = {}
+        for entry in entries:
+            if entry["action"] in ["update", "unchanged"]:
+                groups.setdefault(self.merge_key(rows[entry["row_id"]]), []).append(entry)
+        for group in groups.values():
+            if len(group) == 1:
+                continue
+            lead = group[0]
+            group_rows = [rows[entry["row_id"]] for entry in group]
+            if len({self.bundle_kind(row) for row in group_rows}) > 1:
+                self.log.log(f'rows {", ".join(str(row.get("ROW_ID")) for row in group_rows)} post picklist and contact values to one column, row {lead.get("ROW_ID")} wins')
+            worker = self.row_worker()
+            worker.inputs = dict(group_rows[0], value_bundle=self.merge_bundles(group_rows))
+            value_bundle = worker.inputs['value_bundle']
+            for key in ["column", "action"]:
+                lead.pop(key, None)
+            lead.update({"value_count":len(value_bundle), "value_hash":hashlib.sha1(json.dumps(value_bundle, sort_keys=True).encode()).hexdigest(),
+                "merged_rows":[{"row_id":entry["row_id"], "ROW_ID":entry.get("ROW_ID")} for entry in group[1:]]})
+            if worker.destination_column_unchanged():
+                lead["action"] = "unchanged"
+            elif worker.build_column_update():
+                lead.update({"action":"update", "column":json.loads(json.dumps(worker.inputs['column_props'], default=self.plain_value))})
+            else:
+                lead["action"] = "failed"
+            self.metrics.row_status(lead["row_id"], lead["action"])
+            for entry in group[1:]:
+                entry.pop("column", None)
+                entry.update({"action":"merged", "merged_into":lead["row_id"]})
+                self.metrics.row_status(entry["row_id"], "merged")
+            self.log.log(f'{self.timestamp()} rows {", ".join(str(row.get("ROW_ID")) for row in group_rows)} write the same column, merged into one {lead["action"]} ({self.config.get("merge_policy", "union")})')
+        return entries
+    def plain_value(self, value):
+        '''json fallback for the numpy values a picklist can pick up from df'''
+        return value.item() if hasattr(value, "item") else str(value)
     #endregion
     # region run configurations
-    def run_dynamic_dropdowns(self, row_list):
-        '''loops through each item in list that is enabled, and executes that column update (to refresh the dynamic dropdown options in that column)'''
+    def plan_rows(self, row_list):
+        '''plans each row's column update (on the thread pool), returns one plan entry per row in row_list order'''
+        self.log.log(f'{self.timestamp()} planning column updates...')
+        entries = [None] * len(row_list)
+        def plan_item(item):
+            entries[item[0]] = self.plan_row(item[1], item[0], len(row_list))
+        self.run_workers(plan_item, list(enumerate(row_list)))
+        return entries
+    def plan_row(self, row_data, count, total):
+        '''plans one row on its own row_worker (one unit of work for run_workers)'''
+        row_id = row_data.get("CONDUCTOR_rowid")
+        entry = {"row_id":str(row_id), "ROW_ID":row_data.get("ROW_ID"), "sheet_id":str(row_data.get("DESTINATION_sheet_id")),
+            "column_id":str(row_data.get("DESTINATION_column_id")), "dropdown_type":row_data.get("DESTINATION_dropdown_type")}
+        if row_data.get("SOURCE_grid_obj") == None or row_data.get("DESTINATION_grid_obj") == None or str(row_id) in self.audit_errors:
+            # the audit already logged why this row's sheet or column could not be resolved (planning it would only replace that w/ "Post_Update failed!"),
+            # logged again in case a later write to the row replaced it
+            self.log.log(f'row {row_data.get("ROW_ID")} skipped, it failed the audit')
+            if str(row_id) in self.audit_errors:
+                self.ss_log(row_id, self.audit_errors[str(row_id)], with_print=False)
+            entry["action"] = "skipped"
+        else:
+            with self.metrics.row(row_id):
+                try:
+                    self.log.log(f'{self.timestamp()} planning row {row_data.get("ROW_ID")} ({count+1} of {str(total)})')
+                    entry.update(self.row_worker().plan_column_update(row_data))
+                except Exception as error:
+                    if error_kind(error) in ["throttled", "transient"]:
+                        self.log.log(f'row {row_data.get("ROW_ID")} not planned, Smartsheet still {error_kind(error)} after retries, left for the next run')
+                        entry["action"] = error_kind(error)
+                    else:
+                        self.ss_log(row_id, "Post_Update failed!")
+                        entry["action"] = "failed"
+        self.metrics.row_status(row_id, entry["action"])
+        return entry
+    def build_plan(self, row_list, run_name):
+        '''audits the source and destination sheets of row_list and plans every row, without writing anything.
+        the audit corrections and messages queued meanwhile go into the plan's conductor_writes instead of being flushed'''
+        with self.metrics.phase("planning"):
+            self.source_audit, self.destination_audit = self.auditdata_transformation(row_list)
+        with self.metrics.phase("source_audit"):
+            self.ssdata_audit(self.source_audit, "SOURCE")
+        with self.metrics.phase("destination_audit"):
+            self.ssdata_audit(self.destination_audit, "DESTINATION")
+        with self.metrics.phase("plan_rows"):
+            self.row_bundles = {}
+            entries = self.coalesce_entries(self.plan_rows(row_list), row_list)
+            self.row_bundles = {}
+        with self.write_lock:
+            pending_writes = self.pending_writes
+            self.pending_writes = {}
+        actions = {}
+        for entry in entries:
+            actions[entry["action"]] = actions.get(entry["action"], 0) + 1
+        # every update/unchanged/merged row also gets its POSTED/unchanged/merged message when the plan is applied
+        written_rows = {row_id for row_id, column_id in pending_writes} | {int(entry["row_id"]) for entry in entries if entry["action"] in ["update", "unchanged", "merged"]}
+        return {
+            "run": run_name,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "conductor_sheet_id": str(self.conductor_sheet_id),
+            "actions": actions,
+            "api_calls": {"update_column":actions.get("update", 0), "update_rows":math.ceil(len(written_rows) / self.write_batch_size)},
+            "planning_api_calls": {endpoint:counts.get("calls", 0) for endpoint, counts in self.metrics.report()["endpoints"].items()},
+            "conductor_writes": [{"row_id":str(row_id), "column_id":str(column_id), "value":value} for (row_id, column_id), value in pending_writes.items()],
+            "rows": entries
+        }
+    def apply_plan(self, plan):
+        '''posts a plan from build_plan/plan_run: its Conductor writes, then one update_column per "update" row (and each row's POSTED/unchanged/merged message)'''
+        if str(plan.get("conductor_sheet_id")) != str(self.conductor_sheet_id):
+            raise ValueError(f'plan is for Conductor {plan.get("conductor_sheet_id")}, not {self.conductor_sheet_id}')
+        # a plan this run built already counted its writes when the audit queued them, a loaded one (apply_run) did not
+        built_here = plan is self.__dict__.get("plan")
+        for write in plan.get("conductor_writes"):
+            self.queue_write(write["row_id"], int(write["column_id"]), write["value"], count=not built_here)
+        entries = [entry for entry in plan.get("rows") if entry["action"] in ["update", "unchanged"]]
         self.log.log(f'{self.timestamp()} initiating column updates...')
-        for count, row_data in enumerate(row_list):
+        with self.metrics.phase("dynamic_dropdowns"):
+            self.run_workers(lambda item: self.apply_entry(item[1], item[0], len(entries)), list(enumerate(entries)))
+        with self.metrics.phase("flush_writes"):
+            self.flush_writes("post")
+    def apply_entry(self, entry, count, total):
+        '''posts one planned row (one unit of work for run_workers), rows merged into it get the same status'''
+        row_id = entry["row_id"]
+        if entry["action"] == "unchanged":
+            self.finish_entry(entry, "unchanged")
+            return
+        with self.metrics.row(row_id):
+            try:
+                self.log.log(f'{self.timestamp()} updating row {entry.get("ROW_ID")} ({count+1} of {str(total)})')
+                with self.metrics.phase("posting"):
+                    self.post_update(entry["sheet_id"], entry["column_id"], entry["column"])
+                self.finish_entry(entry, "posted")
+            except Exception as error:
+                if error_kind(error) in ["throttled", "transient"]:
+                    self.log.log(f'row {entry.get("ROW_ID")} not posted, Smartsheet still {error_kind(error)} after retries, left for the next run')
+                    self.finish_entry(entry, error_kind(error))
+                else:
+                    self.finish_entry(entry, "failed")
+    def finish_entry(self, entry, status):
+        '''the PYTHON_MESSAGE and run status of an applied row and of the rows merged into it'''
+        merged_rows = entry.get("merged_rows") or []
+        messages = {"posted":"POSTED", "unchanged":"unchanged"}
+        for row_id, message in [(entry["row_id"], "")] + [(row["row_id"], f' (merged into row {entry.get("ROW_ID")})') for row in merged_rows]:
+            if status in messages:
+                merged = f' (merged w/ {len(merged_rows)} rows)' if merged_rows and not message else message
+                self.log_successful_post(f'{messages[status]}{merged}', row_id)
+            elif status == "failed":
+                self.ss_log(row_id, f"Post_Update failed!{message}")
+            self.metrics.row_status(row_id, status)
+    def save_plan(self, plan, path):
+        '''through a temp file like run_state.save, so a crash mid-write keeps the old plan'''
+        with open(f"{path}.tmp", "w") as file:
+            json.dump(plan, file, indent=2, default=str)
+        os.replace(f"{path}.tmp", path)
+        self.log.log(f'{self.timestamp()} plan written to {path}')
+    def load_plan(self, path):
+        with open(path) as file:
+            return json.load(file)
+    def log_plan(self, plan):
+        actions = ", ".join(f"{count} {action}" for action, count in sorted(plan["actions"].items()))
+        calls = ", ".join(f"{count} {endpoint}" for endpoint, count in plan["api_calls"].items())
+        self.log.log(f'{self.timestamp()} plan: {len(plan["rows"])} rows ({actions}), {len(plan["conductor_writes"])} Conductor writes, applying it takes {calls}')
+    def start_run(self, run_name):
+        '''fresh run_metrics (and value bundle memo, retry and write counts) for this run, api_call records into it through grid.metrics'''
+        self.metrics = run_metrics(run_name)
+        grid.metrics = self.metrics
+        # long running callers (webhook_receiver) log these per run, not since the process started
+        with grid.retry_lock:
+            grid.retry_counts = {}
+        with self.write_lock:
+            self.write_stats = {"queued":0, "cells":0, "calls":0}
+        self.audit_errors = {}
+        # value bundles are only reused within a run, the next run reads the sources again
+        self.value_bundles = {}
+        self.value_bundle_stats = {"computed":0, "reused":0}
+    def run_rows(self, row_list, run_name):
+        '''plans row_list, saves the plan to config "plan_path" if set, then applies it (unless config "dry_run")'''
+        if self.state != None and not self.source_versions:
+            # before planning, so an edit landing while the run plans/applies is not saved under the newer version (cron_run has them from changed_rows)
+            with self.metrics.phase("delta"):
+                self.fetch_source_versions(row_list)
+        self.plan = self.build_plan(row_list, run_name)
+        self.log_plan(self.plan)
+        if self.config.get("plan_path"):
+            self.save_plan(self.plan, self.shard_path(self.config.get("plan_path")))
+        if self.dry_run:
+            self.log.log(f'{self.timestamp()} dry run, plan not applied')
+            return self.plan
+        self.apply_plan(self.plan)
+        self.save_state(row_list)
+        return self.plan
+    def fetch_source_versions(self, row_list):
+        '''the current version of every source sheet in row_list (None if it could not be read), one get_sheet_version call per sheet'''
+        def fetch_version(sheet_id):
             try:
-                self.log.log(f'{self.timestamp()} updating row {row_data.get("ROW_ID")} ({count+1} of {str(len(row_list))})')
-                self.update_columns_dynamic_dropdowns(row_data)
+                self.source_versions[str(sheet_id)] = api_call("get_sheet_version", self.smart.Sheets.get_sheet_version, int(sheet_id)).to_dict().get("version")
             except:
-                self.ss_log(row_data.get("CONDUCTOR_rowid"), "Post_Update failed!")
+                self.source_versions[str(sheet_id)] = None
+        self.source_versions = {}
+        self.run_workers(fetch_version, list({str(row.get("SOURCE_sheet_id")) for row in row_list}))
+        return self.source_versions
+    def row_modified_at(self, row):
+        modified_at = self.conductor_sheet_df.__dict__.get("grid_row_modified_at") or []
+        return modified_at[row.get("index")] if row.get("index") < len(modified_at) else None
+    def changed_rows(self, row_list):
+        '''drops the rows the state file says were posted (or unchanged) w/ the same Conductor contents and source sheet version'''
+        with self.metrics.phase("delta"):
+            self.fetch_source_versions(row_list)
+            changed = [row for row in row_list if not self.state.unchanged(row, self.row_modified_at(row), self.source_versions.get(str(row.get("SOURCE_sheet_id"))))]
+            # rows sharing a destination column w/ a changed row are planned again too, coalesce_entries needs all of them to merge the column's values
+            changed_targets = set().union(*[self.destination_targets(row) for row in changed]) if changed else set()
+            changed_ids = {id(row) for row in changed}
+            changed = [row for row in row_list if id(row) in changed_ids or self.destination_targets(row) & changed_targets]
+        self.log.log(f'{self.timestamp()} {len(changed)} of {len(row_list)} rows changed since the last run')
+        return changed
+    def destination_targets(self, row):
+        '''the destination column of a not yet audited row, by id and by name (either may be blank in the Conductor)'''
+        sheet_id = str(row.get("DESTINATION_sheet_id"))
+        return {(sheet_id, kind, str(value)) for kind, value in [("id", row.get("DESTINATION_column_id")), ("name", row.get("DESTINATION_column_name"))] if value not in [None, ""]}
+    def save_state(self, row_list):
+        '''records the rows this run posted or found unchanged, the rest are forgotten so the next run tries them again'''
+        if self.state == None:
+            return
+        rows = {str(row.get("CONDUCTOR_rowid")):row for row in row_list}
+        statuses = self.metrics.report()["rows"]
+        for entry in self.plan["rows"]:
+            row = rows.get(entry["row_id"])
+            if row != None and statuses.get(entry["row_id"], {}).get("status") in ["posted", "unchanged"]:
+                self.state.remember(row, self.row_modified_at(row), self.source_versions.get(str(row.get("SOURCE_sheet_id"))), entry)
+            else:
+                self.state.forget(entry["row_id"])
+        try:
+            self.state.save(self.conductor_sheet_id)
+        except OSError as error:
+            self.log.log(f'{self.timestamp()} state file could not be written: {error}')
+    def end_run(self):
+        '''flushes what is left to write, logs the run's stats, and writes the run report (config "report_dir") and summary field (config "summary_field")'''
+        with self.metrics.phase("flush_writes"):
+            self.flush_writes("exit")
+        if self.pending_writes and not self.dry_run:
+            self.log.log(f'{self.timestamp()} {len(self.pending_writes)} Conductor cell writes could not be flushed (still throttled), the next run writes them again')
+        self.log_write_savings()
+        self.log_cache_stats()
+        self.log_retry_stats()
+        self.log_value_bundle_stats()
+        self.metrics.finish()
+        summary = self.metrics.summary()
+        self.log.log(f'{self.timestamp()} {summary}')
+        if self.config.get("report_dir"):
+            try:
+                json_path, csv_path = self.metrics.write(self.config.get("report_dir"))
+                self.log.log(f'{self.timestamp()} run report written to {json_path} and {csv_path}')
+            except OSError as error:
+                self.log.log(f'{self.timestamp()} run report could not be written: {error}')
+        # a shard's summary would overwrite the other shards', sharded_cron_run posts the merged one
+        if self.config.get("summary_field") and not self.dry_run and self.shard_count == 1:
+            self.post_run_summary(summary)
+    def post_run_summary(self, summary):
+        '''writes the run summary into the Conductor sheet summary field titled config "summary_field"'''
+        try:
+            fields = api_call("get_sheet_summary_fields", self.smart.Sheets.get_sheet_summary_fields, self.conductor_sheet_id).to_dict().get("data") or []
+            field_ids = [field.get("id") for field in fields if field.get("title") == self.config.get("summary_field")]
+            if not field_ids:
+                self.log.log(f'no summary field titled {self.config.get("summary_field")} on the Conductor sheet')
+                return
+            api_call("update_sheet_summary_fields", self.smart.Sheets.update_sheet_summary_fields, self.conductor_sheet_id,
+                [self.smart.models.SummaryField({'id':field_ids[0], 'objectValue':summary})])
+        except:
+            self.log.log("run summary could not be posted to the Conductor summary field")
+    def plan_run(self, input_rowid_list=None):
+        '''builds the plan for every enabled row (or just input_rowid_list) and returns it, nothing is written to Smartsheet'''
+        self.start_run("plan_run")
+        dry_run = self.dry_run
+        self.dry_run = True
+        try:
+            with self.metrics.phase("generate_conductor_dict"):
+                self.row_list = self.generate_conductor_dict()
+                if input_rowid_list != None:
+                    self.row_list = self.filterin_focused_rows(self.row_list, input_rowid_list)
+            return self.run_rows(self.row_list, "plan_run")
+        finally:
+            self.end_run()
+            self.dry_run = dry_run
+    def apply_run(self, plan):
+        '''applies a plan from plan_run (i.e. one saved w/ config "plan_path" and read back w/ load_plan)'''
+        self.start_run("apply_run")
+        try:
+            self.apply_plan(plan)
+        finally:
+            self.end_run()
+        self.log.log(f'{self.timestamp()} fin')
     def focused_run(self, input_rowid_list):
         '''executes the dynamic dropdown update on specific row id(s) in input list i.e. [364965002733444]'''
-        self.row_list = self.generate_conductor_dict()
-        self.focused_row_list = self.filterin_focused_rows(self.row_list, input_rowid_list)
-        self.source_audit, self.destination_audit = self.auditdata_transformation(self.focused_row_list)
-        self.ssdata_audit(self.source_audit, "SOURCE")
-        self.ssdata_audit(self.destination_audit, "DESTINATION")
-        self.run_dynamic_dropdowns(self.focused_row_list)
+        self.start_run("focused_run")
+        try:
+            with self.metrics.phase("generate_conductor_dict"):
+                self.row_list = self.generate_conductor_dict()
+                self.focused_row_list = self.filterin_focused_rows(self.row_list, input_rowid_list)
+            self.source_versions = {}
+            self.run_rows(self.focused_row_list, "focused_run")
+        finally:
+            self.end_run()
         self.log.log(f'{self.timestamp()} fin')
     def cron_run(self):
-        '''executes the dynamic dropdown update on all rowids in the conductor sheet (that are enabled)'''
-        self.row_list = self.generate_conductor_dict()
-        self.source_audit, self.destination_audit = self.auditdata_transformation(self.row_list)
-        self.ssdata_audit(self.source_audit, "SOURCE")
-        self.ssdata_audit(self.destination_audit, "DESTINATION")
-        self.run_dynamic_dropdowns(self.row_list)
+        '''executes the dynamic dropdown update on all rowids in the conductor sheet (that are enabled), or just this shard's rows w/ config "shard_count"'''
+        run_name = "cron_run" if self.shard_count == 1 else f"cron_run shard {self.shard_index + 1}/{self.shard_count}"
+        self.start_run(run_name)
+        try:
+            with self.metrics.phase("generate_conductor_dict"):
+                self.row_list = self.generate_conductor_dict()
+                if self.shard_count > 1:
+                    self.row_list = self.shard_rows(self.row_list)
+            self.source_versions = {}
+            if self.state != None:
+                self.row_list = self.changed_rows(self.row_list)
+            self.run_rows(self.row_list, run_name)
+        finally:
+            self.end_run()
         self.log.log(f'{self.timestamp()} fin')
+        return self.metrics.report()
+    def sharded_cron_run(self, shard_count=None):
+        '''cron_run split into shard_count processes (default one per core), each working the rows of its own destination sheets (see shard_rows).
+        their reports are merged into one, which is logged, written to config "report_dir" and posted to config "summary_field" like a cron_run's.
+        to spread the shards over hosts instead, run cron_run w/ config "shard_index"/"shard_count" on each host (and merge_reports their reports if wanted)'''
+        shard_count = shard_count or os.cpu_count() or 1
+        # the config goes to the worker processes, so it cannot carry a client object (each process opens its own)
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        config = {key:value for key, value in self.config.items() if key != "smart_client"}
+        self.log.log(f'{self.timestamp()} starting cron_run in {shard_count} shards')
+        with ProcessPoolExecutor(max_workers=shard_count, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(run_shard, config, shard_index, shard_count) for shard_index in range(shard_count)]
+            reports = []
+            for shard_index, future in enumerate(futures):
+                try:
+                    reports.append(future.result())
+                except Exception as error:
+                    self.log.log(f'{self.timestamp()} shard {shard_index + 1} of {shard_count} failed: {error}')
+        if not reports:
+            return None
+        report = merge_reports(reports, f"sharded_cron_run {len(reports)}/{shard_count} shards")
+        summary = report_summary(report)
+        self.log.log(f'{self.timestamp()} {summary}')
+        if self.config.get("report_dir"):
+            try:
+                json_path, csv_path = write_report(report, self.config.get("report_dir"))
+                self.log.log(f'{self.timestamp()} run report written to {json_path} and {csv_path}')
+            except OSError as error:
+                self.log.log(f'{self.timestamp()} run report could not be written: {error}')
+        if self.config.get("summary_field") and not self.dry_run:
+            self.post_run_summary(summary)
+        self.log.log(f'{self.timestamp()} fin')
+        return report
 
     # endregion
 
+def run_shard(config, shard_index, shard_count):
+    '''one shard of sharded_cron_run in its own process (module level so the process pool can pickle it), returns the shard's run report'''
+    return ConductorV2(dict(config, shard_index=shard_index, shard_count=shard_count)).cron_run()
+
 if __name__ == "__main__":
-    config = {'stoken':smartsheet_automation_token, 'conductor_sheet_id': 7237912061339524}
+    config = {'stoken':master_token(), 'conductor_sheet_id': 7237912061339524}
     con = ConductorV2(config)
     con.cron_run()
     # con.focused_run([5335898348064644])
\ No newline at end of file
@@ -0,0 +1,303 @@
+import copy
+import json
+import time
+import random
+import secrets
+import itertools
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from smartsheet import models
+from smartsheet.exceptions import ApiError, RateLimitExceededError
+from smartsheet_grid import last_response
+
+CONDUCTOR_TITLES = ["ROW_ID", "CONDUCTOR_rowid", "ENABLED", "DESCRIPTION", "WEBHOOK_ID", "SOURCE_sheet_name", "SOURCE_sheet_id", "SOURCE_column_name", "SOURCE_column_id",
+    "DESTINATION_sheet_id", "DESTINATION_column_name", "DESTINATION_column_id", "DESTINATION_dropdown_type", "PYTHON_MESSAGE"]
+
+def api_error(status_code, code, message):
+    '''the exception the sdk raises (w/ errors_as_exceptions) for an error response'''
+    error = models.Error({'result': {'statusCode': status_code, 'code': code, 'message': message, 'shouldRetry': status_code in [429, 500, 503]}})
+    if status_code == 429:
+        return RateLimitExceededError(error, message)
+    return ApiError(error, message, status_code in [500, 503])
+
+class fake_response:
+    '''stands in for the sdk's result objects, data is built fresh per call so to_dict can hand it over as is'''
+    def __init__(self, data):
+        self.data = data
+    def to_dict(self):
+        return self.data
+
+class fake_sheets:
+    '''the Sheets endpoints ConductorV2 and grid use, on the sheets held by a fake_smartsheet'''
+    def __init__(self, server):
+        self.server = server
+
+    def get_columns(self, sheet_id, level=None, include=None, include_all=False):
+        sheet = self.server.request("get_columns", sheet_id)
+        return self.server.respond({'data': copy.deepcopy(sheet['columns']), 'totalCount': len(sheet['columns'])})
+
+    def get_column_by_title(self, sheet_id, title, include=None):
+        sheet = self.server.request("get_column_by_title", sheet_id)
+        for column in sheet['columns']:
+            if column['title'] == title:
+                return self.server.respond(copy.deepcopy(column))
+        raise api_error(404, 1006, 'Not Found')
+
+    def get_sheet_version(self, sheet_id):
+        sheet = self.server.request("get_sheet_version", sheet_id)
+        return self.server.respond({'version': sheet['version']})
+
+    def get_sheet(self, sheet_id, include=None, exclude=None, row_ids=None, row_numbers=None, column_ids=None, page_size=None, page=None,
+            if_version_after=None, level=None, rows_modified_since=None, filter_id=None):
+        sheet = self.server.request("get_sheet", sheet_id)
+        columns = sheet['columns']
+        if column_ids:
+            wanted = {int(column_id) for column_id in column_ids}
+            columns = [column for column in columns if column['id'] in wanted]
+        column_set = {column['id'] for column in columns}
+        rows = sheet['rows']
+        if rows_modified_since:
+            rows = [row for row in rows if row['modifiedAt'] > str(rows_modified_since)]
+        if page_size:
+            rows = rows[((page or 1) - 1) * page_size:(page or 1) * page_size]
+        object_value = include != None and 'objectValue' in str(include)
+        self.server.row_latency(len(rows) * len(columns))
+        out_rows = []
+        for row in rows:
+            cells = []
+            for cell in row['cells']:
+                if cell['columnId'] in column_set:
+                    cell = dict(cell)
+                    if not object_value:
+                        cell.pop('objectValue', None)
+                    cells.append(cell)
+            out_rows.append({'id': row['id'], 'rowNumber': row['rowNumber'], 'modifiedAt': row['modifiedAt'], 'cells': cells})
+        return self.server.respond({'id': sheet['id'], 'name': sheet['name'], 'version': sheet['version'], 'totalRowCount': len(sheet['rows']),
+            'columns': copy.deepcopy(columns), 'rows': out_rows})
+
+    def update_rows(self, sheet_id, list_of_rows):
+        sheet = self.server.request("update_rows", sheet_id)
+        rows = {row['id']: row for row in sheet['rows']}
+        with self.server.lock:
+            for new_row in list_of_rows:
+                row = rows.get(int(new_row.id))
+                if row == None:
+                    raise api_error(404, 1006, 'Not Found')
+                cells = {cell['columnId']: cell for cell in row['cells']}
+                for new_cell in new_row.cells:
+                    cell = cells.get(int(new_cell.column_id))
+                    if cell != None:
+                        cell['value'] = new_cell.value
+                        cell['displayValue'] = None if new_cell.value == None else str(new_cell.value)
+                row['modifiedAt'] = self.server.now()
+            sheet['version'] += 1
+        return self.server.respond({'message': 'SUCCESS', 'resultCode': 0})
+
+    def update_column(self, sheet_id, column_id, column_obj):
+        sheet = self.server.request("update_column", sheet_id)
+        update = column_obj.to_dict()
+        with self.server.lock:
+            for column in sheet['columns']:
+                if column['id'] == int(column_id):
+                    for key in ['type', 'options', 'contactOptions']:
+                        if key in update:
+                            column[key] = update[key]
+                    sheet['version'] += 1
+                    return self.server.respond({'message': 'SUCCESS', 'resultCode': 0, 'result': copy.deepcopy(column)})
+        raise api_error(404, 1006, 'Not Found')
+
+    def get_sheet_summary_fields(self, sheet_id, include=None, exclude=None, page_size=None, page=None, include_all=None):
+        sheet = self.server.request("get_sheet_summary_fields", sheet_id)
+        return self.server.respond({'data': copy.deepcopy(sheet['summary']), 'totalCount': len(sheet['summary'])})
+
+    def update_sheet_summary_fields(self, sheet_id, list_of_summary_fields, rename_if_conflict=None):
+        sheet = self.server.request("update_sheet_summary_fields", sheet_id)
+        fields = {field['id']: field for field in sheet['summary']}
+        with self.server.lock:
+            for new_field in list_of_summary_fields:
+                field = fields.get(int(new_field.id))
+                if field != None:
+                    field['objectValue'] = new_field.to_dict().get('objectValue')
+                    field['displayValue'] = str(field['objectValue'])
+        return self.server.respond({'message': 'SUCCESS', 'resultCode': 0})
+
+class fake_passthrough:
+    '''Passthrough.get for "/sheets/{id}" (what grid.fetch_content uses), other endpoints are not faked'''
+    def __init__(self, server):
+        self.server = server
+
+    def get(self, endpoint, query_params=None):
+        query_params = query_params or {}
+        parts = endpoint.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "sheets":
+            raise api_error(404, 1000, f'{endpoint} is not faked')
+        column_ids = query_params.get("columnIds")
+        return self.server.Sheets.get_sheet(int(parts[1]), include=query_params.get("include"), level=query_params.get("level"),
+            column_ids=[int(column_id) for column_id in str(column_ids).split(",")] if column_ids else None,
+            page_size=query_params.get("pageSize"), page=query_params.get("page"), rows_modified_since=query_params.get("rowsModifiedSince"))
+
+class fake_webhooks:
+    '''the Webhooks endpoints webhook_receiver uses, each webhook gets its own sharedSecret like the real api'''
+    def __init__(self, server):
+        self.server = server
+        self.webhooks = {}
+
+    def webhook(self, endpoint, webhook_id):
+        webhook = self.webhooks.get(int(webhook_id))
+        if webhook == None:
+            raise api_error(404, 1004, 'Not Found')
+        self.server.request(endpoint, webhook['scopeObjectId'])
+        return webhook
+
+    def create_webhook(self, webhook_obj):
+        webhook = webhook_obj.to_dict()
+        self.server.request("create_webhook", webhook.get('scopeObjectId'))
+        with self.server.lock:
+            webhook.update({'id': next(self.server.ids), 'enabled': False, 'status': 'NEW_NOT_VERIFIED', 'sharedSecret': secrets.token_hex(16)})
+            self.webhooks[webhook['id']] = webhook
+        return self.server.respond({'message': 'SUCCESS', 'resultCode': 0, 'result': copy.deepcopy(webhook)})
+
+    def get_webhook(self, webhook_id):
+        return self.server.respond(copy.deepcopy(self.webhook("get_webhook", webhook_id)))
+
+    def update_webhook(self, webhook_id, webhook_obj):
+        '''only enabled is updated, enabling does not run the verification challenge (post to the receiver yourself to test it)'''
+        webhook = self.webhook("update_webhook", webhook_id)
+        with self.server.lock:
+            enabled = webhook_obj.to_dict().get('enabled')
+            if enabled != None:
+                webhook.update({'enabled': enabled, 'status': 'ENABLED' if enabled else 'DISABLED_BY_OWNER'})
+        return self.server.respond({'message': 'SUCCESS', 'resultCode': 0, 'result': copy.deepcopy(webhook)})
+
+class fake_smartsheet:
+
+    """
+    In memory stand-in for the smartsheet.Smartsheet client, so ConductorV2 can be run and timed without touching real sheets.
+
+    Dependencies
+    ------------
+    smartsheet (only for its models and exceptions)
+
+    Attributes
+    __________
+    latency: float
+        seconds every call waits before it is answered
+    latency_per_cell: float
+        extra seconds per cell a get_sheet returns (big sheets are slow to fetch)
+    requests_per_minute: int
+        when set, calls past this many in the last window_seconds get a 429 like the real api
+    window_seconds: float
+        length of the rate limit window (60, shorten it to test throttling quickly)
+
+    Methods
+    -------
+    add_sheet(name, columns, rows, summary=None) ---> adds a sheet and returns its id. columns are (title, type) pairs, rows are lists of cell values (dicts for contacts)
+    column_id(sheet_id, title) ---> the id of the column with that title
+    counts ---> dict of endpoint: calls answered, throttled counts the 429s
+
+    pass it as config "smart_client" (ConductorV2) or client (grid), see fake_workload for a generated Conductor and its sheets
+    """
+
+    models = models
+
+    def __init__(self, latency=0, latency_per_cell=0, requests_per_minute=None, window_seconds=60):
+        self.latency = latency
+        self.latency_per_cell = latency_per_cell
+        self.requests_per_minute = requests_per_minute
+        self.window_seconds = window_seconds
+        self.sheets = {}
+        self.counts = {}
+        self.ids = itertools.count(1000000)
+        self.calls = deque()
+        self.lock = threading.RLock()
+        self.Sheets = fake_sheets(self)
+        self.Passthrough = fake_passthrough(self)
+        self.Webhooks = fake_webhooks(self)
+
+    def errors_as_exceptions(self, value=True):
+        pass
+
+    def now(self):
+        return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def request(self, endpoint, sheet_id):
+        '''counts the call, enforces the rate limit, waits latency and returns the sheet (404 if there is none)'''
+        with self.lock:
+            if self.requests_per_minute != None:
+                now = time.monotonic()
+                while self.calls and now - self.calls[0] > self.window_seconds:
+                    self.calls.popleft()
+                if len(self.calls) >= self.requests_per_minute:
+                    self.counts["throttled"] = self.counts.get("throttled", 0) + 1
+                    raise api_error(429, 4003, 'Rate limit exceeded.')
+                self.calls.append(now)
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+            sheet = self.sheets.get(int(sheet_id))
+        if self.latency:
+            time.sleep(self.latency)
+        if sheet == None:
+            raise api_error(404, 1006, 'Not Found')
+        return sheet
+
+    def row_latency(self, cells):
+        if self.latency_per_cell:
+            time.sleep(cells * self.latency_per_cell)
+
+    def respond(self, data):
+        '''records the response size where grid's api_call reads it (the real client's response hook does the same)'''
+        last_response.bytes = len(json.dumps(data, default=str))
+        return fake_response(data)
+
+    def add_sheet(self, name, columns, rows, summary=None):
+        sheet_id = next(self.ids)
+        sheet_columns = [{'id': next(self.ids), 'index': index, 'title': title, 'type': column_type, 'primary': index == 0, 'version': 0, 'width': 150}
+            for index, (title, column_type) in enumerate(columns)]
+        sheet_rows = []
+        for number, values in enumerate(rows):
+            cells = []
+            for column, value in zip(sheet_columns, values):
+                cell = {'columnId': column['id']}
+                if isinstance(value, dict):
+                    cell.update({'objectValue': dict(value, objectType='CONTACT'), 'value': value.get('email'), 'displayValue': value.get('name')})
+                elif value != None:
+                    cell.update({'value': value, 'displayValue': str(value)})
+                cells.append(cell)
+            sheet_rows.append({'id': next(self.ids), 'rowNumber': number + 1, 'modifiedAt': self.now(), 'cells': cells})
+        self.sheets[sheet_id] = {'id': sheet_id, 'name': name, 'version': 1, 'columns': sheet_columns, 'rows': sheet_rows,
+            'summary': [{'id': next(self.ids), 'title': title, 'type': 'TEXT_NUMBER', 'objectValue': None} for title in (summary or [])]}
+        return sheet_id
+
+    def column_id(self, sheet_id, title):
+        return [column['id'] for column in self.sheets[int(sheet_id)]['columns'] if column['title'] == title][0]
+
+def fake_workload(conductor_rows, source_sheets=5, destination_sheets=5, source_rows=(50, 2000), distinct_values=40, contact_share=0.25, seed=0, **client_args):
+    '''a fake_smartsheet w/ source_sheets source sheets (row counts drawn from source_rows), destination_sheets destination sheets and a Conductor
+    of conductor_rows rows spread over them (contact_share of them contact dropdowns). returns (client, conductor_sheet_id)'''
+    rand = random.Random(seed)
+    client = fake_smartsheet(**client_args)
+    contacts = [{'email': f'person{index}@example.com', 'name': f'Person {index}'} for index in range(distinct_values)]
+    source_ids = []
+    for index in range(source_sheets):
+        row_count = rand.randint(*source_rows)
+        source_ids.append(client.add_sheet(f'source {index}', [('Name', 'TEXT_NUMBER'), ('Trade', 'TEXT_NUMBER'), ('Phase', 'TEXT_NUMBER'), ('Owner', 'CONTACT_LIST')],
+            [[f'item {row}', f'trade {rand.randrange(distinct_values)}', f'phase {rand.randrange(distinct_values)}', rand.choice(contacts)] for row in range(row_count)]))
+    plans = []
+    for index in range(conductor_rows):
+        is_contact = rand.random() < contact_share
+        plans.append({
+            'source': rand.choice(source_ids),
+            'source_column': 'Owner' if is_contact else rand.choice(['Trade', 'Phase']),
+            'destination': index % destination_sheets,
+            'type': rand.choice(['contact', 'multi-contact']) if is_contact else rand.choice(['picklist', 'multi-picklist'])
+        })
+    destination_ids = []
+    for index in range(destination_sheets):
+        columns = [('Name', 'TEXT_NUMBER')] + [(f'dropdown {row}', 'CONTACT_LIST' if 'contact' in plan['type'] else 'PICKLIST')
+            for row, plan in enumerate(plans) if plan['destination'] == index]
+        destination_ids.append(client.add_sheet(f'destination {index}', columns, [[f'row {row}'] + [None] * (len(columns) - 1) for row in range(20)]))
+    conductor_sheet_id = client.add_sheet('ConductorV2', [(title, 'TEXT_NUMBER') for title in CONDUCTOR_TITLES], [
+        [row + 1, None, True, '', None, client.sheets[plan['source']]['name'], str(plan['source']), plan['source_column'], None,
+            str(destination_ids[plan['destination']]), f'dropdown {row}', None, plan['type'], None]
+        for row, plan in enumerate(plans)], summary=['Last run'])
+    return client, conductor_sheet_id
@@ -1,11 +1,14 @@
 from datetime import datetime
 import os
 import sys
-import inspect
+import atexit
+import threading
 
 class ghetto_logger:
-    '''to deploy in class, put self.log=ghetto_logger("<module name>.py"), then ctr f and replace print( w/ self.log.log('''
-    def __init__(self, title, debug = False):
+    '''to deploy in class, put self.log=ghetto_logger("<module name>.py"), then ctr f and replace print( w/ self.log.log(
+    the log file is opened once and written through a buffer, flush_interval seconds apart by a background thread (and at exit / flush()).
+    flush_interval=None leaves the flushing to the buffer, flush() and exit'''
+    def __init__(self, title, debug = False, flush_interval = 1.0):
         raw_now = datetime.now()
         self.debug= debug
         self.now = raw_now.strftime("%m/%d/%Y %H:%M:%S")
@@ -15,22 +18,61 @@ class ghetto_logger:
             self.path ="C:\Egnyte\Private\cobyvardy\Other_Projects\Python\Conductor_Script\V2_Production\deployment_logger.txt"
         else:
             self.path ="av_logger.txt"
+        self.file = None
+        self.lock = threading.Lock()
+        self.flush_interval = flush_interval
+        self.flusher = None
+        self.stopped = threading.Event()
 
-    def log(self, text, type = "new_line", mode="a"):
-        function_name = inspect.currentframe().f_back.f_code.co_name
-        
-        try:
-            module_name = inspect.getmodule(inspect.stack()[1][0]).__name__
-        except:
-            module_name = "__main__"
+    def open(self, mode):
+        '''(re)opens the handle, mode="w" truncates the file like it did when every log call opened it'''
+        if self.file != None and mode == "a":
+            return
+        if self.file != None:
+            self.file.close()
+        else:
+            # only while the file is open, so atexit does not keep every logger ever made alive (close unregisters it)
+            atexit.register(self.close)
+        self.file = open(self.path, mode=mode, buffering=64 * 1024)
+        if self.flush_interval != None and self.flusher == None:
+            # each flusher gets its own event, so close() can stop it even if a new one is started right after
+            self.stopped = threading.Event()
+            self.flusher = threading.Thread(target=self.flush_loop, args=(self.stopped,), daemon=True)
+            self.flusher.start()
+
+    def flush_loop(self, stopped):
+        while not stopped.wait(self.flush_interval):
+            self.flush()
 
-        func_stamp = f"{module_name}.{function_name}(): "
+    def log(self, text, type = "new_line", mode="a"):
+        # the caller's frame directly (inspect.stack() builds every frame's info and reads the source files)
+        frame = sys._getframe(1)
+        func_stamp = f"{frame.f_globals.get('__name__', '__main__')}.{frame.f_code.co_name}(): "
 
-        with open(self.path, mode=mode) as file:
+        with self.lock:
+            self.open(mode)
             if self.first_use == True:
-                file.write("\n" + "\n"+ self.first_line_stamp)
+                self.file.write("\n" + "\n"+ self.first_line_stamp)
                 self.first_use = False
             if self.first_use == False and type == "paragraph":
-                file.write(text)
+                self.file.write(text)
             elif self.first_use == False:
-                file.write("\n  " + func_stamp + text)
\ No newline at end of file
+                self.file.write("\n  " + func_stamp + text)
+
+    def flush(self):
+        with self.lock:
+            if self.file != None and not self.file.closed:
+                self.file.flush()
+
+    def close(self):
+        '''stops the flusher, flushes and closes the handle (registered w/ atexit while it is open), logging after this reopens it'''
+        with self.lock:
+            flusher = self.flusher
+            self.flusher = None
+            self.stopped.set()
+            if self.file != None:
+                self.file.close()
+                self.file = None
+                atexit.unregister(self.close)
+        if flusher != None and flusher is not threading.current_thread():
+            flusher.join()
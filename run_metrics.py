@@ -0,0 +1,170 @@
+import os
+import csv
+import json
+import time
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+class run_metrics:
+
+    """
+    Timings and api call counts for one cron_run/focused_run, written out as a JSON/CSV run report.
+
+    Dependencies
+    ------------
+    json, csv (standard library)
+
+    Attributes
+    __________
+    run_name: str
+        i.e. "cron_run", ends up in the report and the summary line
+
+    Methods
+    -------
+    phase(name) ---> context manager that adds the time spent inside it to that phase
+    row(row_id) ---> context manager that times one Conductor row and counts the api calls made on its thread against it
+    record_call(endpoint, seconds, size, failed) ---> one api call (api_call does this when it is set as grid.metrics)
+    record_sheet(sheet_id, location, seconds, rows, ok) ---> one sheet fetch from the audits
+    report() ---> everything above as a dict, sheets slowest first
+    write(report_dir) ---> writes the report as run_report_<start>.json and .csv, returns both paths
+    summary() ---> one line version of the report (for the log and the Conductor summary field)
+
+    write_report, report_summary and merge_reports (module level) do the same on report dicts, i.e. the reports a sharded run's processes send back.
+
+    phases that run once per row (value_gathering, posting) add up the time of every worker thread, so with max_workers > 1 they can be longer than the run.
+    """
+
+    def __init__(self, run_name):
+        self.run_name = run_name
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.seconds = None
+        self.lock = threading.Lock()
+        self.current = threading.local()
+        self.phases = {}
+        self.endpoints = {}
+        self.sheets = []
+        self.rows = {}
+
+    def add(self, table, key, values):
+        '''adds values into table[key] (summing what is already there)'''
+        with self.lock:
+            totals = table.setdefault(key, {})
+            for name, value in values.items():
+                totals[name] = totals.get(name, 0) + value
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(self.phases, name, {"seconds":time.perf_counter() - start, "count":1})
+
+    @contextmanager
+    def row(self, row_id):
+        start = time.perf_counter()
+        self.current.row_id = row_id
+        try:
+            yield
+        finally:
+            self.current.row_id = None
+            self.add(self.rows, row_id, {"seconds":time.perf_counter() - start})
+
+    def row_status(self, row_id, status):
+        with self.lock:
+            self.rows.setdefault(row_id, {})["status"] = status
+
+    def record_call(self, endpoint, seconds, size=None, failed=False):
+        self.add(self.endpoints, endpoint, {"calls":1, "seconds":seconds, "bytes":size or 0, "errors":int(failed)})
+        row_id = getattr(self.current, "row_id", None)
+        if row_id != None:
+            self.add(self.rows, row_id, {"api_calls":1})
+
+    def record_sheet(self, sheet_id, location, seconds, rows, ok):
+        with self.lock:
+            self.sheets.append({"sheet_id":str(sheet_id), "location":location, "seconds":round(seconds, 3), "rows":rows, "ok":ok})
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.start
+
+    def report(self):
+        seconds = self.seconds if self.seconds != None else time.perf_counter() - self.start
+        with self.lock:
+            statuses = {}
+            for row in self.rows.values():
+                statuses[row.get("status", "none")] = statuses.get(row.get("status", "none"), 0) + 1
+            return {
+                "run": self.run_name,
+                "started_at": self.started_at.isoformat(timespec="seconds"),
+                "seconds": round(seconds, 3),
+                "totals": {
+                    "api_calls": sum(endpoint.get("calls", 0) for endpoint in self.endpoints.values()),
+                    "bytes": sum(endpoint.get("bytes", 0) for endpoint in self.endpoints.values()),
+                    "rows": len(self.rows),
+                    "row_statuses": statuses
+                },
+                "phases": {name:{"seconds":round(phase["seconds"], 3), "count":phase["count"]} for name, phase in self.phases.items()},
+                "endpoints": {name:dict(endpoint, seconds=round(endpoint["seconds"], 3)) for name, endpoint in self.endpoints.items()},
+                "sheets": sorted(self.sheets, key=lambda sheet: -sheet["seconds"]),
+                "rows": {str(row_id):dict(row, seconds=round(row.get("seconds", 0), 3)) for row_id, row in self.rows.items()}
+            }
+
+    def write(self, report_dir):
+        return write_report(self.report(), report_dir)
+
+    def summary(self):
+        return report_summary(self.report())
+
+def write_report(report, report_dir):
+    '''writes report as run_report_<start>_<run>.json and .csv, the csv has one line per phase, endpoint, sheet and row (section, name, count, seconds, bytes, detail)
+    so runs can be compared in a spreadsheet'''
+    os.makedirs(report_dir, exist_ok=True)
+    started_at = datetime.fromisoformat(report["started_at"])
+    stem = os.path.join(report_dir, f"run_report_{started_at.strftime('%Y%m%d_%H%M%S')}_{report['run'].replace(' ', '_').replace('/', 'of')}")
+    with open(f"{stem}.json", "w") as file:
+        json.dump(report, file, indent=2, default=str)
+    with open(f"{stem}.csv", "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["section", "name", "count", "seconds", "bytes", "detail"])
+        writer.writerow(["run", report["run"], report["totals"]["api_calls"], report["seconds"], report["totals"]["bytes"], report["started_at"]])
+        for name, phase in report["phases"].items():
+            writer.writerow(["phase", name, phase["count"], phase["seconds"], "", ""])
+        for name, endpoint in report["endpoints"].items():
+            writer.writerow(["endpoint", name, endpoint.get("calls"), endpoint.get("seconds"), endpoint.get("bytes"), f'{endpoint.get("errors", 0)} errors'])
+        for sheet in report["sheets"]:
+            writer.writerow(["sheet", sheet["sheet_id"], sheet["rows"], sheet["seconds"], "", f'{sheet["location"]} {"ok" if sheet["ok"] else "failed"}'])
+        for row_id, row in report["rows"].items():
+            writer.writerow(["row", row_id, row.get("api_calls", 0), row.get("seconds"), "", row.get("status", "")])
+    return f"{stem}.json", f"{stem}.csv"
+
+def report_summary(report):
+    totals = report["totals"]
+    statuses = ", ".join(f"{count} {status}" for status, count in sorted(totals["row_statuses"].items()))
+    slowest = report["sheets"][0] if report["sheets"] else None
+    started_at = datetime.fromisoformat(report["started_at"])
+    line = f'{report["run"]} {started_at.strftime("%m/%d %H:%M")}: {report["seconds"]}s, {totals["api_calls"]} api calls ({round(totals["bytes"] / 1024 / 1024, 2)}MB), {totals["rows"]} rows ({statuses})'
+    if slowest != None:
+        line += f', slowest sheet {slowest["sheet_id"]} ({slowest["seconds"]}s)'
+    return line
+
+def merge_reports(reports, run_name):
+    '''one report out of the reports of a sharded run: phases and endpoints are summed (so they are busy time across shards), sheets and rows combined,
+    and seconds is the slowest shard'''
+    merged = {"run":run_name, "started_at":min(report["started_at"] for report in reports), "seconds":max(report["seconds"] for report in reports),
+        "totals":{"api_calls":0, "bytes":0, "rows":0, "row_statuses":{}}, "phases":{}, "endpoints":{}, "sheets":[], "rows":{}, "shards":len(reports)}
+    for report in reports:
+        for name in ["api_calls", "bytes", "rows"]:
+            merged["totals"][name] += report["totals"][name]
+        for status, count in report["totals"]["row_statuses"].items():
+            merged["totals"]["row_statuses"][status] = merged["totals"]["row_statuses"].get(status, 0) + count
+        for section in ["phases", "endpoints"]:
+            for name, values in report[section].items():
+                totals = merged[section].setdefault(name, {})
+                for key, value in values.items():
+                    totals[key] = round(totals.get(key, 0) + value, 3)
+        merged["sheets"].extend(report["sheets"])
+        merged["rows"].update(report["rows"])
+    merged["sheets"].sort(key=lambda sheet: -sheet["seconds"])
+    return merged
@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+class run_state:
+
+    """
+    What the previous runs resolved for each Conductor row, kept in a json file so cron_run only re-plans the rows that changed.
+
+    Dependencies
+    ------------
+    json (standard library)
+
+    Attributes
+    __________
+    path: str
+        the state file (created on the first save)
+    full_refresh_hours: float
+        a row is re-planned at least this often even if nothing it depends on changed (i.e. someone edited a destination dropdown by hand)
+
+    Methods
+    -------
+    row_key(row) ---> hash of the Conductor fields that decide what a row does (the column ids too, the audit trusts those over the names)
+    unchanged(row, modified_at, source_version) ---> True when the row was posted (or found unchanged) at this Conductor row modifiedAt/contents and source sheet version
+    remember(row, modified_at, source_version, entry) ---> records a row that was posted or found unchanged (ids, column index, value hash)
+    forget(row_id) ---> drops a row so the next run re-plans it
+    save() ---> writes the file (through a temp file, so a crash mid-write keeps the old state)
+
+    a row's modifiedAt also moves when this script writes its PYTHON_MESSAGE or ids, so a newer modifiedAt only counts as a change if row_key changed too
+    """
+
+    key_fields = ["ENABLED", "SOURCE_sheet_id", "SOURCE_column_name", "SOURCE_column_id", "DESTINATION_sheet_id", "DESTINATION_column_name", "DESTINATION_column_id", "DESTINATION_dropdown_type"]
+    id_fields = ["SOURCE_column_id", "DESTINATION_column_id"]
+
+    def __init__(self, path, full_refresh_hours=24):
+        self.path = path
+        self.full_refresh_hours = full_refresh_hours
+        self.lock = threading.Lock()
+        self.rows = {}
+        self.conductor_sheet_id = None
+        if os.path.exists(path):
+            try:
+                with open(path) as file:
+                    state = json.load(file)
+                self.rows = state.get("rows") or {}
+                self.conductor_sheet_id = state.get("conductor_sheet_id")
+            except ValueError:
+                # a corrupt state file only costs one full run
+                self.rows = {}
+
+    def key_value(self, row, field):
+        '''the field as a string, ids normalised so the audit's int and the Conductor's text compare equal'''
+        value = row.get(field)
+        if field in self.id_fields:
+            try:
+                return str(int(value))
+            except (TypeError, ValueError):
+                pass
+        return str(value)
+
+    def row_key(self, row):
+        return hashlib.sha1(json.dumps([self.key_value(row, field) for field in self.key_fields]).encode()).hexdigest()
+
+    def unchanged(self, row, modified_at, source_version):
+        saved = self.rows.get(str(row.get("CONDUCTOR_rowid")))
+        if saved == None or source_version == None or saved.get("source_version") != source_version:
+            return False
+        if time.time() - saved.get("planned_at", 0) > self.full_refresh_hours * 3600:
+            return False
+        return saved.get("modified_at") == modified_at or saved.get("row_key") == self.row_key(row)
+
+    def remember(self, row, modified_at, source_version, entry):
+        with self.lock:
+            self.rows[str(row.get("CONDUCTOR_rowid"))] = {
+                "modified_at": modified_at,
+                "row_key": self.row_key(row),
+                "source_version": source_version,
+                "SOURCE_column_id": str(row.get("SOURCE_column_id")),
+                "DESTINATION_column_id": str(row.get("DESTINATION_column_id")),
+                "column_index": row.get("SOURCE_column_index"),
+                "value_hash": entry.get("value_hash"),
+                "action": entry.get("action"),
+                "planned_at": time.time()
+            }
+
+    def forget(self, row_id):
+        with self.lock:
+            self.rows.pop(str(row_id), None)
+
+    def save(self, conductor_sheet_id=None):
+        with self.lock:
+            state = {"conductor_sheet_id": str(conductor_sheet_id or self.conductor_sheet_id), "saved_at": time.time(), "rows": self.rows}
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with open(f"{self.path}.tmp", "w") as file:
+                json.dump(state, file, default=str)
+            os.replace(f"{self.path}.tmp", self.path)
@@ -0,0 +1,90 @@
+import os
+import time
+import pickle
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+@contextmanager
+def sqlite_connection(path):
+    '''a new connection per call (sqlite connections cannot be shared between threads), committed and closed on exit. sheet_cache and value_index both use it'''
+    connection = sqlite3.connect(path, timeout=30)
+    try:
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+class sheet_cache:
+
+    """
+    On disk cache of grid snapshots, so sheets that have not changed since the last run are not downloaded again.
+
+    Dependencies
+    ------------
+    sqlite3, pickle (standard library)
+
+    Attributes
+    __________
+    cache_dir: str
+        directory that holds sheet_cache.sqlite (created if missing)
+    max_bytes: int
+        size cap for all snapshots together, the least recently used snapshots are dropped past it (value_index.sqlite in the same directory is not counted)
+
+    Methods
+    -------
+    get(sheet_id, variant, version) ---> returns the snapshot stored for that sheet/variant if it was taken at this sheet version, otherwise None
+    put(sheet_id, variant, version, snapshot) ---> stores the snapshot (any picklable object) and trims the cache back under max_bytes
+    clear() ---> deletes every snapshot
+
+    a variant is whatever the caller needs to tell different fetches of the same sheet apart (i.e. "columns", or the get_sheet arguments)
+    """
+
+    def __init__(self, cache_dir, max_bytes=500 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.path = os.path.join(cache_dir, "sheet_cache.sqlite")
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        with self.connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots (sheet_id INTEGER, variant TEXT, version INTEGER, size INTEGER, last_used REAL, snapshot BLOB, PRIMARY KEY (sheet_id, variant))"
+            )
+
+    def connect(self):
+        return sqlite_connection(self.path)
+
+    def get(self, sheet_id, variant, version):
+        with self.lock, self.connect() as connection:
+            found = connection.execute(
+                "SELECT snapshot FROM snapshots WHERE sheet_id = ? AND variant = ? AND version = ?", (int(sheet_id), variant, version)
+            ).fetchone()
+            if found == None:
+                self.misses += 1
+                return None
+            connection.execute("UPDATE snapshots SET last_used = ? WHERE sheet_id = ? AND variant = ?", (time.time(), int(sheet_id), variant))
+            self.hits += 1
+        return pickle.loads(found[0])
+
+    def put(self, sheet_id, variant, version, snapshot):
+        blob = pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock, self.connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?)", (int(sheet_id), variant, version, len(blob), time.time(), blob)
+            )
+            self.evict(connection)
+
+    def evict(self, connection):
+        '''drops least recently used snapshots until the cache is under max_bytes'''
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM snapshots").fetchone()[0]
+        for sheet_id, variant, size in connection.execute("SELECT sheet_id, variant, size FROM snapshots ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            connection.execute("DELETE FROM snapshots WHERE sheet_id = ? AND variant = ?", (sheet_id, variant))
+            total -= size
+
+    def clear(self):
+        with self.lock, self.connect() as connection:
+            connection.execute("DELETE FROM snapshots")
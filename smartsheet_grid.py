@@ -1,6 +1,11 @@
 #!/usr/bin/env python
 
-import smartsheet, pandas as pd
+# smartsheet, pandas and requests are imported where they are first needed, so importing this module (and constructing a ConductorV2) stays fast
+import json
+import time
+import random
+import threading
+import tracemalloc
 
 class grid:
 
@@ -8,6 +13,9 @@ class grid:
     Global Variable
     ____________
     token --> MUST BE SET BEFORE PROCEEDING. >>> grid.token = {SMARTSHEET_ACCES_TOKEN}
+    limiter --> optional token_bucket shared by every api_call (and so every thread). >>> grid.limiter = token_bucket(300)
+    cache --> optional sheet_cache, column_df and fetch_content are then reused from disk while the sheet version is unchanged. >>> grid.cache = sheet_cache("cache_dir")
+    client --> optional Smartsheet client every grid uses (i.e. the caller's own, or a stand-in). Otherwise one shared client per token is made by shared_client.
 
     Dependencies
     ------------
@@ -18,52 +26,166 @@ class grid:
     __________
     grid_id: int
         sheet id of an existing Smartsheet sheet. terst 1
+    client: smartsheet.Smartsheet
+        optional client for just this grid, overrides grid.client
 
     Methods
     -------
     grid_id --> returns the grid_id
-    grid_content ---> returns the content of a sheet as a dictionary.
+    grid_content ---> returns the content of a sheet as a dictionary (only kept when fetch_content is called with keep_content=True).
     grid_columns ---> returns a list of the column names.
-    grid_rows ---> returns a list of lists. each sub-list contains all the 'display values' of each cell in that row.
+    grid_rows ---> returns a list of lists. each sub-list contains all the 'display values' of each cell in that row (rebuilt from df on each access).
     grid_row_ids---> returns a list o
     f all the row ids
+    grid_row_modified_at ---> returns a list of each row's modifiedAt (same order as grid_row_ids)
     grid_column_ids ---> returns a list of all the column ids
+    column_index ---> returns column_df as dicts keyed by column id and by title (see get_column_index).
+    grid_cells ---> returns a dict of column id: list of raw cell dicts (objectValue and all), only for the cell_column_ids passed to fetch_content
     df ---> returns a pandas DataFrame of the sheet.
+    fetch_stats ---> with grid.measure_memory, the rows/columns/seconds/peak_bytes of the last fetch_content.
+    iter_column_cells ---> yields one column's raw cells (row id, modifiedAt, cell) a page at a time, for sheets too big to hold in memory.
+    fetch_column_cells ---> returns one column's raw cells (row id, modifiedAt, cell) and the sheet's totalRowCount, optionally only rows modified since a timestamp.
+    fetch_columns ---> metadata only version of fetch_content, fills the column attributes and an empty df without downloading any rows.
+    measure_fetch_savings ---> returns the bytes/seconds a column only fetch saves over a full get_sheet for this sheet.
     delete_all_rows ---> deletes all rows in the sheet (in preperation for updating).
 
     """
 
     token = None
+    limiter = None
+    cache = None
+    client = None
+    # a run_metrics, when set api_call records every call's time and response size in it
+    metrics = None
+    # one client (one requests session / keep-alive connection pool) per token, see shared_client
+    clients = {}
+    clients_lock = threading.Lock()
+    # attributes fetch_content sets, these are what gets stored in the cache (grid_content is left out, it is the same data again as a dict)
+    snapshot_attrs = ["grid_name", "grid_columns", "grid_row_ids", "grid_row_modified_at", "grid_column_ids", "grid_cells", "df"]
+    # set True to record time/peak allocation per fetch_content in fetch_stats (uses tracemalloc, so it slows fetches down)
+    measure_memory = False
+    # api_call retries throttled (429) and transient (5xx, connection) errors up to max_retries times, waiting Retry-After or an exponential backoff w/ jitter
+    max_retries = 6
+    backoff_base = 1
+    backoff_cap = 60
+    # endpoint: {"throttled": n, "transient": n, "gave_up": n}
+    retry_counts = {}
+    retry_lock = threading.Lock()
 
-    def __init__(self, grid_id):
+    def __init__(self, grid_id, client=None):
+        '''no api calls here, column_df and the row attributes load on first use (see __getattr__)'''
         self.grid_id = grid_id
+        if client != None:
+            self.client = client
         self.grid_content = None
-        self.column_df = self.get_column_df()
+        self.grid_cells = {}
+        self.version = None
+
+    def __getattr__(self, name):
+        '''only called for attributes that are not set yet: column_df is fetched on first use unless a fetch_content already filled it,
+        and the row attributes (df, grid_rows, ...) run a plain fetch_content. so a grid only makes the api calls its caller actually needs'''
+        if name == "column_df":
+            self.column_df = self.get_column_df()
+            return self.column_df
+        if name == "column_index":
+            self.column_index = self.get_column_index()
+            return self.column_index
+        if name == "grid_rows" and "df" in self.__dict__:
+            # not stored by fetch_content (it would be a second copy of df), rebuilt on request
+            return self.df.drop(columns="id").values.tolist()
+        if (name in self.snapshot_attrs or name == "grid_rows") and self.token != None:
+            self.fetch_content()
+            if name == "grid_rows" and "df" in self.__dict__:
+                # rebuilt from df like above, fetch_content does not store it
+                return self.df.drop(columns="id").values.tolist()
+            return self.__dict__.get(name)
+        raise AttributeError(f"'grid' object has no attribute '{name}'")
     
+    @classmethod
+    def shared_client(cls, token=None, pool_size=8):
+        '''returns the one client for this token, made on first use w/ a keep-alive connection pool of pool_size (size it to the worker count).
+        asking for a bigger pool than the current client has replaces it'''
+        import smartsheet
+        token = token or cls.token
+        with cls.clients_lock:
+            client, client_pool_size = cls.clients.get(token, (None, 0))
+            if client == None or pool_size > client_pool_size:
+                # the sdk's own retry loop is turned off (max_retry_time=0), api_call does the retrying so it can share the backoff across threads
+                client = smartsheet.Smartsheet(access_token=token, max_connections=pool_size, max_retry_time=0)
+                client.errors_as_exceptions(True)
+                hooks = client._session.hooks.get("response") or []
+                client._session.hooks["response"] = (hooks if isinstance(hooks, list) else [hooks]) + [record_response]
+                cls.clients[token] = (client, pool_size)
+            return client
+
+    def smart_client(self):
+        '''the client this grid's api calls go through: its own, then grid.client, then the shared client for grid.token'''
+        if self.client != None:
+            return self.client
+        return self.shared_client(self.token)
+
     def get_column_df(self):
+        import pandas as pd
         if self.token == None:
             return "MUST SET TOKEN"
         else:
-            smart = smartsheet.Smartsheet(access_token=self.token)
-            smart.errors_as_exceptions(True)
-            return pd.DataFrame.from_dict(
-            (smart.Sheets.get_columns(self.grid_id, level=2, include='objectValue', include_all=True)).to_dict().get("data")
+            cached = self.cache_get("columns")
+            if cached is not None:
+                return cached
+            smart = self.smart_client()
+            column_df = pd.DataFrame.from_dict(
+            (api_call("get_columns", smart.Sheets.get_columns, self.grid_id, level=2, include='objectValue', include_all=True)).to_dict().get("data")
         )
+            self.cache_put("columns", column_df)
+            return column_df
+
+    def get_column_index(self):
+        '''column_df as dicts for O(1) lookups: by_id (column id: the column's fields plus its position in column_df) and by_title (title: column id).
+        kept in grid.cache per sheet version like column_df'''
+        cached = self.cache_get("column_index")
+        if cached is not None:
+            return cached
+        by_id = {}
+        by_title = {}
+        for position, column in enumerate(self.column_df.to_dict("records")):
+            column_id = int(column.get("id"))
+            by_id[column_id] = dict(column, position=position)
+            by_title.setdefault(column.get("title"), column_id)
+        column_index = {"by_id":by_id, "by_title":by_title}
+        self.cache_put("column_index", column_index)
+        return column_index
+
+    def get_version(self):
+        '''the sheet's version number (cheap api call, it goes up on every change to the sheet), fetched once per grid object'''
+        if self.version == None:
+            smart = self.smart_client()
+            self.version = api_call("get_sheet_version", smart.Sheets.get_sheet_version, self.grid_id).to_dict().get("version")
+        return self.version
+
+    def cache_get(self, variant):
+        '''returns the cached snapshot for this variant of the sheet if grid.cache is set and the sheet has not changed since, otherwise None'''
+        if self.cache == None:
+            return None
+        return self.cache.get(self.grid_id, variant, self.get_version())
+
+    def cache_put(self, variant, snapshot):
+        if self.cache != None:
+            self.cache.put(self.grid_id, variant, self.get_version(), snapshot)
 
     def df_id_by_col(self, column_names):
+        import pandas as pd
         if self.token == None:
             return "MUST SET TOKEN"
         else:
-            smart = smartsheet.Smartsheet(access_token=self.token)
-            smart.errors_as_exceptions(True)
+            smart = self.smart_client()
             columnids = []
             col_index = []
             for col in column_names:
-                col1 = smart.Sheets.get_column_by_title(self.grid_id, col)
+                col1 = api_call("get_column_by_title", smart.Sheets.get_column_by_title, self.grid_id, col)
                 columnids.append(col1.to_dict().get("id"))
                 col_index.append(col1.to_dict().get("index"))
             sorted_col = [x for y, x in sorted(zip(col_index, column_names))]
-            sfetch = smart.Sheets.get_sheet(self.grid_id, column_ids=columnids)
+            sfetch = api_call("get_sheet", smart.Sheets.get_sheet, self.grid_id, column_ids=columnids)
             cols = ["id"] + sorted_col
             c = []
             p = sfetch.to_dict()
@@ -75,48 +197,144 @@ class grid:
                 c.append(l)
             return pd.DataFrame(c, columns=cols)
 
-    def fetch_content(self):
+    def fetch_content(self, level=None, include=None, cell_column_ids=None, column_ids=None, keep_content=False):
+        '''level/include are passed to get_sheet (i.e. level=2, include="objectValue" for contacts),
+        cell_column_ids keeps the raw cell dicts of those columns in grid_cells so callers dont have to re-download the sheet,
+        column_ids only downloads those columns (grid_columns/df then only hold those columns, column_df still has all of them).
+        without column_ids and before column_df is loaded, column_df is filled from this response's columns (saves the get_columns call).
+        the response is read straight from the json (no sdk models) into one list per column, then into df. grid_content (the raw dict) is only kept w/ keep_content=True,
+        and grid_rows is rebuilt from df when asked for. w/ grid.measure_memory the time and peak allocation of the fetch go in fetch_stats'''
+        import pandas as pd
         if self.token == None:
             return "MUST SET TOKEN"
         else:
-            smart = smartsheet.Smartsheet(access_token=self.token)
-            smart.errors_as_exceptions(True)
-            self.grid_content = (smart.Sheets.get_sheet(self.grid_id)).to_dict()
-            self.grid_name = (self.grid_content).get("name")
+            variant = f"content level={level} include={include} cell_column_ids={cell_column_ids} column_ids={column_ids}"
+            cached = self.cache_get(variant)
+            if cached is not None:
+                self.__dict__.update(cached)
+                return
+            if self.measure_memory:
+                start = time.time()
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                tracemalloc.reset_peak()
+            smart = self.smart_client()
+            query_params = {"level":level, "include":include, "columnIds":",".join(str(column_id) for column_id in column_ids) if column_ids else None}
+            content = (api_call("get_sheet", smart.Passthrough.get, f"/sheets/{self.grid_id}", {key:value for key, value in query_params.items() if value != None})).to_dict()
+            cell_column_ids = [int(column_id) for column_id in (cell_column_ids or [])]
+            self.grid_cells = {column_id:[] for column_id in cell_column_ids}
+            self.grid_name = content.get("name")
             # this attributes pulls the column headers
-            self.grid_columns = [i.get("title") for i in (self.grid_content).get("columns")]
-            # note that the grid_rows is equivelant to the cell's 'Display Value'
-            self.grid_rows = []
-            if (self.grid_content).get("rows") == None:
-                self.grid_rows = []
-            else:
-                for i in (self.grid_content).get("rows"):
-                    b = i.get("cells")
-                    c = []
-                    for i in b:
-                        l = i.get("displayValue")
-                        m = i.get("value")
-                        if l == None:
-                            c.append(m)
-                        else:
-                            c.append(l)
-                    (self.grid_rows).append(c)
-            self.grid_rows = self.grid_rows
-            if (self.grid_content).get("rows") == None:
-                self.grid_row_ids = []
-            else:
-                self.grid_row_ids = [i.get("id") for i in (self.grid_content).get("rows")]
-            self.grid_column_ids = [i.get("id") for i in (self.grid_content).get("columns")]
-            self.df = pd.DataFrame(self.grid_rows, columns=self.grid_columns)
+            self.grid_columns = [i.get("title") for i in content.get("columns")]
+            self.grid_column_ids = [i.get("id") for i in content.get("columns")]
+            # note that the values are equivelant to the cell's 'Display Value' (or value when there is none)
+            column_values = [[] for column in self.grid_columns]
+            self.grid_row_ids = []
+            self.grid_row_modified_at = []
+            for row in content.get("rows") or []:
+                self.grid_row_ids.append(row.get("id"))
+                self.grid_row_modified_at.append(row.get("modifiedAt"))
+                for position, cell in enumerate(row.get("cells")):
+                    if cell.get("columnId") in self.grid_cells:
+                        self.grid_cells[cell.get("columnId")].append(cell)
+                    display_value = cell.get("displayValue")
+                    column_values[position].append(cell.get("value") if display_value == None else display_value)
+            self.df = pd.DataFrame({title:values for title, values in zip(self.grid_columns, column_values)}, columns=self.grid_columns)
+            del column_values
             self.df["id"]=self.grid_row_ids
+            # only a level 2 response types MULTI_PICKLIST/MULTI_CONTACT_LIST columns like get_column_df does (below that they come back TEXT_NUMBER)
+            if column_ids == None and level == 2 and "column_df" not in self.__dict__:
+                self.column_df = pd.DataFrame.from_dict(content.get("columns"))
+            self.grid_content = content if keep_content else None
+            del content
+            if self.measure_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                self.fetch_stats = {"sheet_id":self.grid_id, "rows":len(self.grid_row_ids), "columns":len(self.grid_columns),
+                    "seconds":round(time.time() - start, 3), "peak_bytes":peak, "max_rss_kb":None}
+                try:
+                    # resource only exists on posix (not on the windows dev computers)
+                    import resource
+                    self.fetch_stats["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                except ImportError:
+                    pass
+            snapshot = {attr:getattr(self, attr) for attr in self.snapshot_attrs}
+            if "column_df" in self.__dict__:
+                snapshot["column_df"] = self.column_df
+            self.cache_put(variant, snapshot)
+    def fetch_column_cells(self, column_id, level=None, include=None, rows_modified_since=None):
+        '''downloads a single column, returns {"rows": [(row_id, modifiedAt, cell dict)], "total_row_count": rows on the whole sheet}.
+        with rows_modified_since (ISO-8601) only the rows changed after it come back, which is what keeps value_index updates small'''
+        if self.token == None:
+            return "MUST SET TOKEN"
+        else:
+            smart = self.smart_client()
+            content = api_call("get_sheet", smart.Sheets.get_sheet, self.grid_id, level=level, include=include, column_ids=[int(column_id)], rows_modified_since=rows_modified_since).to_dict()
+            rows = []
+            for row in content.get("rows") or []:
+                cells = row.get("cells") or [{}]
+                rows.append((row.get("id"), row.get("modifiedAt"), cells[0]))
+            return {"rows":rows, "total_row_count":content.get("totalRowCount")}
+    def iter_column_cells(self, column_id, page_size=5000, level=None, include=None):
+        '''yields (row_id, modifiedAt, cell dict) for a single column, reading the sheet page_size rows at a time (page/pageSize),
+        so only one page is ever held in memory whatever the sheet size. rows edited while paging can shift between pages, so callers that need an exact snapshot should check the sheet version'''
+        if self.token == None:
+            return
+        smart = self.smart_client()
+        page = 1
+        while True:
+            query_params = {"columnIds":str(int(column_id)), "pageSize":page_size, "page":page, "level":level, "include":include}
+            content = api_call("get_sheet", smart.Passthrough.get, f"/sheets/{self.grid_id}", {key:value for key, value in query_params.items() if value != None}).to_dict()
+            rows = content.get("rows") or []
+            for row in rows:
+                cells = row.get("cells") or [{}]
+                yield row.get("id"), row.get("modifiedAt"), cells[0]
+            # past the last page Smartsheet answers with the last page again, so stop on the row count
+            if len(rows) < page_size or page * page_size >= (content.get("totalRowCount") or 0):
+                return
+            page += 1
+    def fetch_columns(self):
+        '''metadata only version of fetch_content, for callers that only need column_df (ids, titles, index, options).
+        fills the column attributes and leaves the row attributes empty, so no rows are downloaded'''
+        import pandas as pd
+        if self.token == None:
+            return "MUST SET TOKEN"
+        else:
+            self.grid_columns = self.column_df['title'].tolist()
+            self.grid_column_ids = self.column_df['id'].tolist()
+            self.grid_rows = []
+            self.grid_row_ids = []
+            self.grid_row_modified_at = []
+            self.df = pd.DataFrame(columns=self.grid_columns + ["id"])
+    def measure_fetch_savings(self):
+        '''times and sizes (json bytes) a column only fetch against a full get_sheet of this sheet, costs one of each api call so it is for diagnostics only'''
+        if self.token == None:
+            return "MUST SET TOKEN"
+        else:
+            smart = self.smart_client()
+            start = time.time()
+            columns = api_call("get_columns", smart.Sheets.get_columns, self.grid_id, level=2, include='objectValue', include_all=True).to_dict()
+            columns_seconds = time.time() - start
+            start = time.time()
+            sheet = api_call("get_sheet", smart.Sheets.get_sheet, self.grid_id).to_dict()
+            sheet_seconds = time.time() - start
+            columns_bytes = len(json.dumps(columns, default=str))
+            sheet_bytes = len(json.dumps(sheet, default=str))
+            return {
+                "sheet_id":self.grid_id,
+                "rows":len(sheet.get("rows") or []),
+                "columns_bytes":columns_bytes,
+                "sheet_bytes":sheet_bytes,
+                "bytes_saved":sheet_bytes - columns_bytes,
+                "seconds_saved":round(sheet_seconds - columns_seconds, 3)
+            }
     def fetch_formulas(self):
         '''for getting formulas in cells'''
+        import pandas as pd
         if self.token == None:
             return "MUST SET TOKEN"
         else:
-            smart = smartsheet.Smartsheet(access_token=self.token)
-            smart.errors_as_exceptions(True)
-            self.grid_content = (smart.Sheets.get_sheet(self.grid_id)).to_dict()
+            smart = self.smart_client()
+            self.grid_content = (api_call("get_sheet", smart.Sheets.get_sheet, self.grid_id)).to_dict()
             self.grid_name = (self.grid_content).get("name")
             # this attributes pulls the column headers
             self.grid_columns = [i.get("title") for i in (self.grid_content).get("columns")]
@@ -146,12 +364,12 @@ class grid:
             self.df = pd.DataFrame(self.grid_rows, columns=self.grid_columns)
             self.df["id"]=self.grid_row_ids
     def fetch_summary_content(self):
+        import pandas as pd
         if self.token == None:
             return "MUST SET TOKEN"
         else:
-            smart = smartsheet.Smartsheet(access_token=self.token)
-            smart.errors_as_exceptions(True)
-            self.grid_content = (smart.Sheets.get_sheet_summary_fields(self.grid_id)).to_dict()
+            smart = self.smart_client()
+            self.grid_content = (api_call("get_sheet_summary_fields", smart.Sheets.get_sheet_summary_fields, self.grid_id)).to_dict()
             # this attributes pulls the column headers
             self.summary_params=[ 'title','createdAt', 'createdBy', 'displayValue', 'formula', 'id', 'index', 'locked', 'lockedForUser', 'modifiedAt', 'modifiedBy', 'objectValue', 'type']
             self.grid_rows = []
@@ -176,9 +394,109 @@ class grid:
         if self.token == None:
             return "MUST SET TOKEN"
         else:
-            smart = smartsheet.Smartsheet(access_token=self.token)
-            smart.errors_as_exceptions(True)
+            smart = self.smart_client()
             regex_string = f'[{exclusion_string}]'
             self.column_reduction =  self.column_df[self.column_df['title'].str.contains(regex_string,regex=True)==False]
             self.reduced_column_ids = list(self.column_reduction.id)
             self.reduced_column_names = list(self.column_reduction.title)
+
+class token_bucket:
+    '''thread safe token bucket, acquire() blocks until the next request fits in the budget.
+    Smartsheet allows 300 requests per minute per access token, so one bucket should be shared by everything using that token'''
+    def __init__(self, requests_per_minute=300, burst=None):
+        self.rate = requests_per_minute / 60
+        self.capacity = burst or max(1, requests_per_minute // 6)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+    def pause(self, seconds):
+        '''empties the bucket for seconds, so after a 429 every thread waits instead of just the one that got it'''
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate, 1 - seconds * self.rate)
+            self.updated = now
+
+# size and Retry-After of the last response on this thread, set by record_response (the sdk's results and exceptions dont carry either)
+last_response = threading.local()
+
+def record_response(response, *args, **kwargs):
+    '''requests response hook installed by grid.shared_client'''
+    last_response.bytes = len(response.content or b"")
+    if response.status_code in [429, 503]:
+        last_response.retry_after = response.headers.get("Retry-After")
+    return response
+
+def error_kind(error):
+    '''sorts an exception from an api call into "throttled" (429), "transient" (5xx, timeouts, dropped connections), "not_found" (404, or 403 for a sheet that is not shared) or "error"'''
+    import requests
+    import smartsheet
+    if isinstance(error, smartsheet.exceptions.RateLimitExceededError):
+        return "throttled"
+    result = getattr(getattr(error, "error", None), "result", None)
+    status_code = getattr(result, "status_code", None) or getattr(error, "status_code", None)
+    if status_code == 429:
+        return "throttled"
+    if isinstance(error, (smartsheet.exceptions.UnexpectedRequestError, requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return "transient"
+    if getattr(error, "should_retry", False) or getattr(result, "should_retry", False) or (isinstance(status_code, int) and status_code >= 500):
+        return "transient"
+    if status_code in [403, 404]:
+        return "not_found"
+    return "error"
+
+def count_retry(endpoint, kind):
+    with grid.retry_lock:
+        counts = grid.retry_counts.setdefault(endpoint, {})
+        counts[kind] = counts.get(kind, 0) + 1
+
+def retry_wait(attempt):
+    '''Retry-After when Smartsheet sent one, otherwise exponential backoff w/ full jitter (so threads that failed together dont retry together)'''
+    seconds = getattr(last_response, "retry_after", None)
+    try:
+        return float(seconds) + random.uniform(0, 1)
+    except (TypeError, ValueError):
+        return random.uniform(0, min(grid.backoff_cap, grid.backoff_base * 2 ** attempt))
+
+def api_call(endpoint, func, *args, **kwargs):
+    '''single entry point for Smartsheet api calls made by grid and ConductorV2 (endpoint is a label i.e. "get_sheet").
+    waits on grid.limiter when one is set, so every worker thread shares the same request budget, and retries throttled/transient errors (see error_kind).
+    other errors, and throttled/transient ones past grid.max_retries, are raised as is so callers can tell them apart w/ error_kind'''
+    attempt = 0
+    while True:
+        if grid.limiter != None:
+            grid.limiter.acquire()
+        last_response.retry_after = None
+        last_response.bytes = None
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+            if grid.metrics != None:
+                grid.metrics.record_call(endpoint, time.perf_counter() - start, last_response.bytes)
+            return result
+        except Exception as error:
+            if grid.metrics != None:
+                grid.metrics.record_call(endpoint, time.perf_counter() - start, last_response.bytes, failed=True)
+            kind = error_kind(error)
+            if kind not in ["throttled", "transient"]:
+                raise
+            if attempt >= grid.max_retries:
+                count_retry(endpoint, "gave_up")
+                raise
+            count_retry(endpoint, kind)
+            wait = retry_wait(attempt)
+            attempt += 1
+            if kind == "throttled" and grid.limiter != None:
+                grid.limiter.pause(wait)
+            else:
+                time.sleep(wait)
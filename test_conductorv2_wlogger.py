@@ -0,0 +1,173 @@
+import os
+import tempfile
+import unittest
+from fake_smartsheet import fake_workload, CONDUCTOR_TITLES
+from conductorv2_wlogger import ConductorV2
+
+class quiet_log:
+    '''stand-in for ghetto_logger so the tests dont write av_logger.txt'''
+    def log(self, text, type="new_line", mode="a"):
+        pass
+
+class conductor_tests(unittest.TestCase):
+
+    """
+    cron_run/focused_run against fake_smartsheet (see fake_workload), checking what ends up on the destination and Conductor sheets.
+    run w/ python -m unittest (or pytest) from the repo root
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.client, self.conductor_sheet_id = fake_workload(12, source_sheets=3, destination_sheets=3, source_rows=(20, 60), contact_share=0.4, seed=1)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def conductor(self, **config):
+        con = ConductorV2(dict({'stoken':'test', 'conductor_sheet_id':self.conductor_sheet_id, 'smart_client':self.client, 'requests_per_minute':10 ** 9}, **config))
+        con.log = quiet_log()
+        return con
+
+    def run_cron(self, **config):
+        '''one cron_run, returns the conductor and the api calls it made per endpoint'''
+        before = dict(self.client.counts)
+        con = self.conductor(**config)
+        con.cron_run()
+        return con, {endpoint:count - before.get(endpoint, 0) for endpoint, count in self.client.counts.items() if count - before.get(endpoint, 0)}
+
+    def conductor_rows(self):
+        '''the Conductor rows as title: value dicts'''
+        return [{title:cell.get('value') for title, cell in zip(CONDUCTOR_TITLES, row['cells'])} | {'id':row['id']} for row in self.client.sheets[self.conductor_sheet_id]['rows']]
+
+    def set_conductor_cell(self, row_number, title, value):
+        '''an edit by hand, so the row's modifiedAt moves past the writes of earlier runs'''
+        row = self.client.sheets[self.conductor_sheet_id]['rows'][row_number]
+        row['cells'][CONDUCTOR_TITLES.index(title)].update({'value':value, 'displayValue':None if value == None else str(value)})
+        row['modifiedAt'] = '2099-01-01T00:00:00Z'
+
+    def source_values(self, row):
+        '''what a row's destination options should be: the distinct values of its source column (emails for contacts)'''
+        sheet = self.client.sheets[int(row['SOURCE_sheet_id'])]
+        column_id = self.client.column_id(sheet['id'], row['SOURCE_column_name'])
+        cells = [cell for source_row in sheet['rows'] for cell in source_row['cells'] if cell['columnId'] == column_id and cell.get('value') != None]
+        if 'contact' in row['DESTINATION_dropdown_type']:
+            return {cell['objectValue']['email'] for cell in cells}
+        return {cell['displayValue'] for cell in cells}
+
+    def destination_values(self, row):
+        sheet = self.client.sheets[int(row['DESTINATION_sheet_id'])]
+        column = [column for column in sheet['columns'] if column['title'] == row['DESTINATION_column_name']][0]
+        if 'contact' in row['DESTINATION_dropdown_type']:
+            return {contact['email'] for contact in column.get('contactOptions') or []}
+        return set(column.get('options') or [])
+
+    def test_cron_run_posts_source_values(self):
+        con, calls = self.run_cron()
+        self.assertEqual(calls.get('update_column'), 12)
+        for row in self.conductor_rows():
+            self.assertEqual(self.destination_values(row), self.source_values(row))
+            self.assertIn('POSTED', row['PYTHON_MESSAGE'])
+            self.assertEqual(str(row['CONDUCTOR_rowid']), str(row['id']))
+
+    def test_second_run_is_unchanged(self):
+        self.run_cron()
+        con, calls = self.run_cron()
+        self.assertEqual(con.plan['actions'], {'unchanged':12})
+        self.assertNotIn('update_column', calls)
+        self.assertTrue(all('unchanged' in row['PYTHON_MESSAGE'] for row in self.conductor_rows()))
+
+    def test_dry_run_writes_nothing(self):
+        con, calls = self.run_cron(dry_run=True)
+        self.assertEqual(con.plan['actions'], {'update':12})
+        self.assertNotIn('update_column', calls)
+        self.assertNotIn('update_rows', calls)
+        self.assertTrue(all(row['PYTHON_MESSAGE'] == None for row in self.conductor_rows()))
+
+    def point_at_first_row(self, row_number):
+        '''makes a Conductor row write the destination column of the first row of the same kind (picklist/contact)'''
+        rows = self.conductor_rows()
+        contact = 'contact' in rows[row_number]['DESTINATION_dropdown_type']
+        first = [number for number, row in enumerate(rows) if ('contact' in row['DESTINATION_dropdown_type']) == contact][0]
+        for title in ['DESTINATION_sheet_id', 'DESTINATION_column_name']:
+            self.set_conductor_cell(row_number, title, rows[first][title])
+        return first
+
+    def test_rows_sharing_a_column_are_merged(self):
+        rows = self.conductor_rows()
+        second = [number for number, row in enumerate(rows) if 'contact' not in row['DESTINATION_dropdown_type']][1]
+        first = self.point_at_first_row(second)
+        con, calls = self.run_cron()
+        self.assertEqual(calls.get('update_column'), 11)
+        self.assertEqual(con.plan['actions'].get('merged'), 1)
+        rows = self.conductor_rows()
+        self.assertEqual(self.destination_values(rows[first]), self.source_values(rows[first]) | self.source_values(rows[second]))
+        self.assertIn('merged w/ 1 rows', rows[first]['PYTHON_MESSAGE'])
+        self.assertIn(f'merged into row {rows[first]["ROW_ID"]}', rows[second]['PYTHON_MESSAGE'])
+
+    def test_priority_merge_keeps_the_first_rows_values(self):
+        rows = self.conductor_rows()
+        second = [number for number, row in enumerate(rows) if 'contact' in row['DESTINATION_dropdown_type']][1]
+        first = self.point_at_first_row(second)
+        self.run_cron(merge_policy='priority')
+        rows = self.conductor_rows()
+        self.assertEqual(self.destination_values(rows[first]), self.source_values(rows[first]))
+
+    def test_state_skips_unchanged_rows(self):
+        state_path = os.path.join(self.directory.name, 'state.json')
+        self.run_cron(state_path=state_path)
+        con, calls = self.run_cron(state_path=state_path)
+        self.assertEqual(con.row_list, [])
+        self.assertNotIn('update_column', calls)
+        # editing a source sheet re-plans (only) the rows reading it
+        row = self.conductor_rows()[0]
+        sheet = self.client.sheets[int(row['SOURCE_sheet_id'])]
+        column_id = self.client.column_id(sheet['id'], row['SOURCE_column_name'])
+        if 'contact' in row['DESTINATION_dropdown_type']:
+            new_value = {'value':'new@example.com', 'displayValue':'New', 'objectValue':{'objectType':'CONTACT', 'email':'new@example.com', 'name':'New'}}
+        else:
+            new_value = {'value':'brand new', 'displayValue':'brand new'}
+        [cell for cell in sheet['rows'][0]['cells'] if cell['columnId'] == column_id][0].update(new_value)
+        sheet['version'] += 1
+        con, calls = self.run_cron(state_path=state_path)
+        self.assertEqual({str(planned['SOURCE_sheet_id']) for planned in con.row_list}, {str(sheet['id'])})
+        self.assertEqual(self.destination_values(self.conductor_rows()[0]), self.source_values(self.conductor_rows()[0]))
+
+    def test_state_replans_a_row_whose_column_id_changed(self):
+        state_path = os.path.join(self.directory.name, 'state.json')
+        self.run_cron(state_path=state_path)
+        rows = self.conductor_rows()
+        other = [number for number, row in enumerate(rows) if row['DESTINATION_sheet_id'] == rows[0]['DESTINATION_sheet_id']][1]
+        self.set_conductor_cell(0, 'DESTINATION_column_id', rows[other]['DESTINATION_column_id'])
+        con, calls = self.run_cron(state_path=state_path)
+        self.assertIn(str(rows[0]['CONDUCTOR_rowid']), {str(planned['CONDUCTOR_rowid']) for planned in con.row_list})
+
+    def test_shards_are_disjoint(self):
+        shard_count = 3
+        destinations = []
+        rows = 0
+        for shard_index in range(shard_count):
+            con, calls = self.run_cron(shard_index=shard_index, shard_count=shard_count)
+            destinations.append({str(row['DESTINATION_sheet_id']) for row in con.row_list})
+            rows += len(con.row_list)
+        self.assertEqual(rows, 12)
+        for shard_index in range(shard_count):
+            for other in range(shard_index + 1, shard_count):
+                self.assertFalse(destinations[shard_index] & destinations[other])
+        for row in self.conductor_rows():
+            self.assertEqual(self.destination_values(row), self.source_values(row))
+
+    def test_failed_source_sheet_keeps_its_error(self):
+        self.set_conductor_cell(0, 'SOURCE_sheet_id', '999')
+        con, calls = self.run_cron()
+        self.assertIn('SHEET ID ERROR', self.conductor_rows()[0]['PYTHON_MESSAGE'])
+
+    def test_bad_column_names_keep_their_error(self):
+        self.set_conductor_cell(0, 'SOURCE_column_name', 'no such column')
+        self.set_conductor_cell(1, 'DESTINATION_column_name', 'no such column')
+        con, calls = self.run_cron()
+        self.assertEqual(con.plan['actions'].get('skipped'), 2)
+        self.assertIn('SOURCE COLUMN NAME ERROR', self.conductor_rows()[0]['PYTHON_MESSAGE'])
+        self.assertIn('DESTINATION COLUMN NAME ERROR', self.conductor_rows()[1]['PYTHON_MESSAGE'])
+
+if __name__ == "__main__":
+    unittest.main()
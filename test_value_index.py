@@ -0,0 +1,90 @@
+import random
+import tempfile
+import unittest
+from fake_smartsheet import fake_smartsheet
+from conductorv2_wlogger import ConductorV2
+from smartsheet_grid import grid
+from value_index import value_index
+from test_conductorv2_wlogger import quiet_log
+
+class value_index_tests(unittest.TestCase):
+
+    """
+    value_index syncs against a fake_smartsheet source sheet, edited between syncs like a user would.
+    run w/ python -m unittest (or pytest) from the repo root
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.client = fake_smartsheet()
+        randomizer = random.Random(3)
+        people = [{'email':f'person{number}@example.com', 'name':f'Person {number}'} for number in range(5)]
+        rows = [[f'row {number}', randomizer.choice(['alpha', 'beta', 'gamma', 'delta', None]), randomizer.choice(people + [None])] for number in range(40)]
+        self.sheet_id = self.client.add_sheet('source', [('Name', 'TEXT_NUMBER'), ('Pick', 'PICKLIST'), ('Owner', 'CONTACT_LIST')], rows)
+        self.pick_id = self.client.column_id(self.sheet_id, 'Pick')
+        self.owner_id = self.client.column_id(self.sheet_id, 'Owner')
+        # sets grid.token/grid.client for the grids below, and is where clean_pick_list lives
+        self.conductor = ConductorV2({'stoken':'test', 'conductor_sheet_id':0, 'smart_client':self.client})
+        self.conductor.log = quiet_log()
+        self.index = value_index(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def sheet(self):
+        '''a new grid per sync, like every run makes (get_version is fetched once per grid)'''
+        return grid(self.sheet_id, client=self.client)
+
+    def counts(self, column_id, kind="picklist"):
+        with self.index.connect() as connection:
+            return dict(connection.execute("SELECT value, count FROM value_counts WHERE sheet_id = ? AND column_id = ? AND kind = ?", (self.sheet_id, column_id, kind)).fetchall())
+
+    def edit(self, row_number, column_id, value):
+        '''an edit by hand: the cell, the row's modifiedAt and the sheet version all move'''
+        row = self.client.sheets[self.sheet_id]['rows'][row_number]
+        [cell for cell in row['cells'] if cell['columnId'] == column_id][0].update({'value':value, 'displayValue':value})
+        row['modifiedAt'] = '2099-01-01T00:00:00Z'
+        self.client.sheets[self.sheet_id]['version'] += 1
+
+    def clean_pick_list(self):
+        self.conductor.inputs = {'SOURCE_column_name':'Pick', 'SOURCE_grid_obj':self.sheet()}
+        return self.conductor.clean_pick_list()
+
+    def test_bundle_matches_clean_pick_list(self):
+        self.assertEqual(self.index.bundle(self.sheet(), self.pick_id, "picklist"), self.clean_pick_list())
+        self.edit(0, self.pick_id, 'brand new')
+        self.assertEqual(self.index.bundle(self.sheet(), self.pick_id, "picklist"), self.clean_pick_list())
+
+    def test_contact_bundle_is_the_distinct_contacts(self):
+        cells = [cell for row in self.client.sheets[self.sheet_id]['rows'] for cell in row['cells'] if cell['columnId'] == self.owner_id and cell.get('objectValue')]
+        contacts = {cell['objectValue']['email']:cell['objectValue']['name'] for cell in cells}
+        self.assertEqual(self.index.bundle(self.sheet(), self.owner_id, "contact"), [{'email':email, 'name':name} for email, name in sorted(contacts.items(), key=lambda contact: contact[1])])
+
+    def test_edit_is_an_update(self):
+        self.assertEqual(self.index.sync(self.sheet(), self.pick_id, "picklist"), "rebuilt")
+        before = self.counts(self.pick_id)
+        values = [[cell.get('displayValue') for cell in row['cells'] if cell['columnId'] == self.pick_id][0] for row in self.client.sheets[self.sheet_id]['rows']]
+        row_number = [number for number, value in enumerate(values) if value != None][0]
+        self.edit(row_number, self.pick_id, 'brand new')
+        self.assertEqual(self.index.sync(self.sheet(), self.pick_id, "picklist"), "updated")
+        after = self.counts(self.pick_id)
+        self.assertEqual(after.get('"brand new"'), 1)
+        self.assertEqual(after.get(f'"{values[row_number]}"', 0), before[f'"{values[row_number]}"'] - 1)
+        self.assertEqual(sum(after.values()), sum(before.values()))
+
+    def test_deleted_row_rebuilds(self):
+        self.index.sync(self.sheet(), self.pick_id, "picklist")
+        del self.client.sheets[self.sheet_id]['rows'][0]
+        self.client.sheets[self.sheet_id]['version'] += 1
+        self.assertEqual(self.index.sync(self.sheet(), self.pick_id, "picklist"), "rebuilt")
+        self.assertEqual(self.index.bundle(self.sheet(), self.pick_id, "picklist"), self.clean_pick_list())
+
+    def test_unchanged_version_fetches_nothing(self):
+        self.index.sync(self.sheet(), self.pick_id, "picklist")
+        before = dict(self.client.counts)
+        self.assertEqual(self.index.sync(self.sheet(), self.pick_id, "picklist"), "unchanged")
+        self.assertEqual(self.client.counts.get('get_sheet'), before.get('get_sheet'))
+        self.assertEqual(self.client.counts.get('get_sheet_version'), before.get('get_sheet_version') + 1)
+
+if __name__ == "__main__":
+    unittest.main()
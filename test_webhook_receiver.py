@@ -0,0 +1,111 @@
+import hmac
+import json
+import time
+import hashlib
+import unittest
+import urllib.error
+import urllib.request
+from fake_smartsheet import fake_workload, CONDUCTOR_TITLES
+from conductorv2_wlogger import ConductorV2
+from webhook_receiver import webhook_receiver
+from test_conductorv2_wlogger import quiet_log
+
+class webhook_receiver_tests(unittest.TestCase):
+
+    """
+    webhook_receiver on a local port against fake_smartsheet, w/ focused_run swapped for a list of the runs it was asked for.
+    run w/ python -m unittest (or pytest) from the repo root
+    """
+
+    def setUp(self):
+        self.client, self.conductor_sheet_id = fake_workload(6, source_sheets=2, destination_sheets=2, source_rows=(10, 20), seed=2)
+        self.conductor = ConductorV2({'stoken':'test', 'conductor_sheet_id':self.conductor_sheet_id, 'smart_client':self.client, 'requests_per_minute':10 ** 9})
+        self.conductor.log = quiet_log()
+        self.runs = []
+        self.conductor.focused_run = lambda rowids: self.runs.append(sorted(str(rowid) for rowid in rowids))
+        self.receiver = webhook_receiver(self.conductor, "https://example.com/hook", host="127.0.0.1", port=0, debounce_seconds=0.2, max_wait_seconds=5)
+        self.receiver.start()
+
+    def tearDown(self):
+        self.receiver.stop()
+
+    def webhooks(self):
+        '''source sheet id: the webhook watching it'''
+        return {str(webhook['scopeObjectId']): webhook for webhook in self.client.Webhooks.webhooks.values()}
+
+    def post(self, payload, headers=None):
+        '''posts to the receiver, returns (status, response headers, response body)'''
+        request = urllib.request.Request(f"http://127.0.0.1:{self.receiver.server.server_port}/", data=json.dumps(payload).encode(), headers=headers or {}, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.headers, error.read()
+
+    def callback(self, sheet_id, object_type="cell", secret=None):
+        '''a callback for sheet_id signed w/ its webhook's sharedSecret (or secret)'''
+        webhook = self.webhooks()[str(sheet_id)]
+        payload = {'webhookId':webhook['id'], 'scope':'sheet', 'scopeObjectId':int(sheet_id), 'events':[{'objectType':object_type, 'eventType':'updated'}]}
+        body = json.dumps(payload).encode()
+        signature = hmac.new((secret or webhook['sharedSecret']).encode(), body, hashlib.sha256).hexdigest()
+        return self.post(payload, {'Smartsheet-Hmac-SHA256':signature})
+
+    def wait_for_runs(self, count, timeout=5):
+        '''waits for count runs, then a little longer so a run that should not happen has time to'''
+        deadline = time.time() + timeout
+        while len(self.runs) < count and time.time() < deadline:
+            time.sleep(0.05)
+        time.sleep(self.receiver.debounce_seconds * 3)
+        return self.runs
+
+    def rowids(self, sheet_id):
+        rows = [{title:cell.get('value') for title, cell in zip(CONDUCTOR_TITLES, row['cells'])} for row in self.client.sheets[self.conductor_sheet_id]['rows']]
+        return sorted(str(row['CONDUCTOR_rowid']) for row in rows if str(row['SOURCE_sheet_id']) == str(sheet_id))
+
+    def test_register_posts_webhook_ids(self):
+        webhooks = self.webhooks()
+        self.assertEqual(set(webhooks), set(self.receiver.sheet_rows))
+        self.assertTrue(all(webhook['enabled'] for webhook in webhooks.values()))
+        for row in self.client.sheets[self.conductor_sheet_id]['rows']:
+            cells = {title:cell.get('value') for title, cell in zip(CONDUCTOR_TITLES, row['cells'])}
+            self.assertEqual(str(cells['WEBHOOK_ID']), str(webhooks[str(cells['SOURCE_sheet_id'])]['id']))
+
+    def test_challenge_is_echoed(self):
+        status, headers, body = self.post({'challenge':'abc123', 'webhookId':1}, {'Smartsheet-Hook-Challenge':'abc123'})
+        self.assertEqual(status, 200)
+        self.assertEqual(headers.get('Smartsheet-Hook-Response'), 'abc123')
+        self.assertEqual(json.loads(body), {'smartsheetHookResponse':'abc123'})
+
+    def test_burst_is_one_run(self):
+        sheet_id = list(self.receiver.sheet_rows)[0]
+        for _ in range(5):
+            self.assertEqual(self.callback(sheet_id)[0], 200)
+        self.assertEqual(self.wait_for_runs(1), [self.rowids(sheet_id)])
+
+    def test_non_row_events_are_ignored(self):
+        sheet_id = list(self.receiver.sheet_rows)[0]
+        self.assertEqual(self.callback(sheet_id, object_type="comment")[0], 200)
+        self.assertEqual(self.callback(sheet_id, object_type="attachment")[0], 200)
+        self.assertEqual(self.wait_for_runs(1, timeout=0.5), [])
+
+    def test_duplicate_callbacks_are_dropped(self):
+        sheet_id = list(self.receiver.sheet_rows)[0]
+        self.callback(sheet_id)
+        self.assertEqual(len(self.wait_for_runs(1)), 1)
+        # same sheet version, so the repeat is a duplicate
+        self.callback(sheet_id)
+        self.assertEqual(len(self.wait_for_runs(2, timeout=0.5)), 1)
+        self.client.sheets[int(sheet_id)]['version'] += 1
+        self.callback(sheet_id)
+        self.assertEqual(len(self.wait_for_runs(2)), 2)
+
+    def test_unsigned_callbacks_are_rejected(self):
+        sheet_id = list(self.receiver.sheet_rows)[0]
+        webhook_id = self.webhooks()[sheet_id]['id']
+        status, headers, body = self.post({'webhookId':webhook_id, 'scopeObjectId':int(sheet_id), 'events':[{'objectType':'cell', 'eventType':'updated'}]})
+        self.assertEqual(status, 403)
+        self.assertEqual(self.callback(sheet_id, secret="not the secret")[0], 403)
+        self.assertEqual(self.wait_for_runs(1, timeout=0.5), [])
+
+if __name__ == "__main__":
+    unittest.main()
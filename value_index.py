@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from sheet_cache import sqlite_connection
+
+class value_index:
+
+    """
+    Persistent distinct value index per (sheet, column, kind), so dropdown options can be produced without rescanning the source column.
+
+    Dependencies
+    ------------
+    sqlite3 (standard library)
+    a grid object for the source sheet (grid_id, get_version, fetch_column_cells, iter_column_cells)
+
+    Attributes
+    __________
+    index_dir: str
+        directory that holds value_index.sqlite (created if missing)
+    full_refresh_hours: float
+        a column is re-read in full at least this often (see sync)
+    page_size: int
+        rows per page when a column is re-read in full, so a rebuild holds one page (plus the distinct values) in memory
+
+    Methods
+    -------
+    bundle(sheet, column_id, kind) ---> syncs the index and returns the dropdown options, sorted values for "picklist", sorted {email, name} dicts for "contact"
+    sync(sheet, column_id, kind) ---> brings the index up to date and returns how ("unchanged", "updated" or "rebuilt")
+
+    each row's value is stored (row id -> value) along with a reference count per value, so a changed row only moves two counts.
+    sync checks the sheet version first (nothing is fetched if it is unchanged), then pulls only the rows modified since the last sync (rowsModifiedSince).
+    Smartsheet does not report deleted rows, so when the indexed row count no longer matches the sheet's totalRowCount the column is rebuilt from a full fetch.
+    a delete and an add between two syncs keep the count equal, which is what full_refresh_hours is for.
+    the file holds one row per source row of every indexed column and is not trimmed (sheet_cache's max_bytes does not count it), deleting it only costs one full read per column.
+    """
+
+    def __init__(self, index_dir, full_refresh_hours=24, page_size=5000):
+        self.index_dir = index_dir
+        self.full_refresh_hours = full_refresh_hours
+        self.page_size = page_size
+        self.path = os.path.join(index_dir, "value_index.sqlite")
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        os.makedirs(index_dir, exist_ok=True)
+        with self.connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS columns (sheet_id INTEGER, column_id INTEGER, kind TEXT, version INTEGER, last_modified TEXT, rebuilt_at REAL, PRIMARY KEY (sheet_id, column_id, kind))")
+            connection.execute("CREATE TABLE IF NOT EXISTS row_values (sheet_id INTEGER, column_id INTEGER, kind TEXT, row_id INTEGER, value TEXT, PRIMARY KEY (sheet_id, column_id, kind, row_id))")
+            connection.execute("CREATE TABLE IF NOT EXISTS value_counts (sheet_id INTEGER, column_id INTEGER, kind TEXT, value TEXT, count INTEGER, PRIMARY KEY (sheet_id, column_id, kind, value))")
+
+    def connect(self):
+        return sqlite_connection(self.path)
+
+    def key_lock(self, key):
+        '''one lock per indexed column, so two rows reading the same column dont sync it at the same time'''
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def cell_value(self, cell, kind):
+        '''the json encoded value a cell contributes (None for blanks), picklists use the display value like grid.fetch_content, contacts the first contact's email/name'''
+        if kind == "contact":
+            object_value = cell.get("objectValue") or {}
+            if "values" in object_value:
+                object_value = (object_value.get("values") or [{}])[0]
+            if not object_value.get("email"):
+                return None
+            return json.dumps({"email":object_value.get("email"), "name":object_value.get("name")}, sort_keys=True)
+        value = cell.get("displayValue") if cell.get("displayValue") != None else cell.get("value")
+        return None if value == None else json.dumps(value)
+
+    def fetch_args(self, kind):
+        return {"level":2, "include":"objectValue"} if kind == "contact" else {}
+
+    def last_modified(self, rows, since=None):
+        '''latest row modifiedAt (as ISO-8601 for rowsModifiedSince), the sdk renders them as "...+00:00Z"'''
+        latest = since
+        for row_id, modified_at, cell in rows:
+            if modified_at == None:
+                continue
+            modified_at = str(modified_at)
+            if modified_at.endswith("Z") and "+" in modified_at[10:]:
+                modified_at = modified_at[:-1]
+            modified_at = datetime.fromisoformat(modified_at.replace("Z", "+00:00")).isoformat()
+            if latest == None or datetime.fromisoformat(modified_at) > datetime.fromisoformat(latest):
+                latest = modified_at
+        return latest
+
+    def sync(self, sheet, column_id, kind):
+        key = (int(sheet.grid_id), int(column_id), kind)
+        with self.key_lock(key):
+            with self.connect() as connection:
+                state = connection.execute("SELECT version, last_modified, rebuilt_at FROM columns WHERE sheet_id = ? AND column_id = ? AND kind = ?", key).fetchone()
+            version = sheet.get_version()
+            if state != None and state[0] == version:
+                return "unchanged"
+            if state == None or time.time() - state[2] > self.full_refresh_hours * 3600:
+                self.rebuild(sheet, key, version)
+                return "rebuilt"
+            fetched = sheet.fetch_column_cells(column_id, rows_modified_since=state[1], **self.fetch_args(kind))
+            with self.connect() as connection:
+                for row_id, modified_at, cell in fetched.get("rows"):
+                    self.apply_row(connection, key, row_id, self.cell_value(cell, kind))
+                row_count = connection.execute("SELECT COUNT(*) FROM row_values WHERE sheet_id = ? AND column_id = ? AND kind = ?", key).fetchone()[0]
+                connection.execute("UPDATE columns SET version = ?, last_modified = ? WHERE sheet_id = ? AND column_id = ? AND kind = ?",
+                    (version, self.last_modified(fetched.get("rows"), state[1])) + key)
+            if fetched.get("total_row_count") != None and row_count != fetched.get("total_row_count"):
+                # rows were deleted since the last sync
+                self.rebuild(sheet, key, version)
+                return "rebuilt"
+            return "updated"
+
+    def apply_row(self, connection, key, row_id, value):
+        '''moves one row from its old value's count to its new value's count'''
+        old = connection.execute("SELECT value FROM row_values WHERE sheet_id = ? AND column_id = ? AND kind = ? AND row_id = ?", key + (row_id,)).fetchone()
+        if old != None and old[0] == value:
+            return
+        if old != None and old[0] != None:
+            connection.execute("UPDATE value_counts SET count = count - 1 WHERE sheet_id = ? AND column_id = ? AND kind = ? AND value = ?", key + (old[0],))
+            connection.execute("DELETE FROM value_counts WHERE sheet_id = ? AND column_id = ? AND kind = ? AND value = ? AND count <= 0", key + (old[0],))
+        if value != None:
+            connection.execute("INSERT INTO value_counts VALUES (?, ?, ?, ?, 1) ON CONFLICT (sheet_id, column_id, kind, value) DO UPDATE SET count = count + 1", key + (value,))
+        connection.execute("INSERT OR REPLACE INTO row_values VALUES (?, ?, ?, ?, ?)", key + (row_id, value))
+
+    def rebuild(self, sheet, key, version):
+        '''re-reads the whole column a page at a time and replaces everything stored for it'''
+        counts = {}
+        latest = None
+        with self.connect() as connection:
+            for table in ["columns", "row_values", "value_counts"]:
+                connection.execute(f"DELETE FROM {table} WHERE sheet_id = ? AND column_id = ? AND kind = ?", key)
+            row_values = []
+            for row_id, modified_at, cell in sheet.iter_column_cells(key[1], self.page_size, **self.fetch_args(key[2])):
+                value = self.cell_value(cell, key[2])
+                if value != None:
+                    counts[value] = counts.get(value, 0) + 1
+                latest = self.last_modified([(row_id, modified_at, cell)], latest)
+                row_values.append(key + (row_id, value))
+                if len(row_values) >= self.page_size:
+                    connection.executemany("INSERT INTO row_values VALUES (?, ?, ?, ?, ?)", row_values)
+                    row_values = []
+            connection.executemany("INSERT INTO row_values VALUES (?, ?, ?, ?, ?)", row_values)
+            connection.executemany("INSERT INTO value_counts VALUES (?, ?, ?, ?, ?)", [key + (value, count) for value, count in counts.items()])
+            connection.execute("INSERT INTO columns VALUES (?, ?, ?, ?, ?, ?)", key + (version, latest, time.time()))
+
+    def bundle(self, sheet, column_id, kind):
+        self.sync(sheet, column_id, kind)
+        with self.connect() as connection:
+            values = [json.loads(found[0]) for found in connection.execute(
+                "SELECT value FROM value_counts WHERE sheet_id = ? AND column_id = ? AND kind = ? AND count > 0", (int(sheet.grid_id), int(column_id), kind))]
+        if kind == "contact":
+            return sorted(values, key=lambda contact: (str(contact.get("name") or ""), contact.get("email")))
+        return sorted(values)
@@ -0,0 +1,237 @@
+import os
+import hmac
+import json
+import time
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from smartsheet_grid import api_call
+
+class webhook_handler(BaseHTTPRequestHandler):
+    '''answers Smartsheet's verification challenge and hands every other (signed) callback to the receiver (set per server by webhook_receiver.start)'''
+    receiver = None
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            payload = {}
+        challenge = self.headers.get("Smartsheet-Hook-Challenge") or payload.get("challenge")
+        if challenge:
+            reply = json.dumps({"smartsheetHookResponse":challenge}).encode()
+            self.send_response(200)
+            self.send_header("Smartsheet-Hook-Response", challenge)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+            return
+        if not self.receiver.signed(payload, body, self.headers.get("Smartsheet-Hmac-SHA256")):
+            self.send_response(403)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.receiver.handle_callback(payload)
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        '''keeps the http server quiet, callbacks are logged by the receiver'''
+        pass
+
+class webhook_receiver:
+
+    """
+    Long running alternative to cron_run: one Smartsheet webhook per SOURCE sheet, and a focused_run for just the Conductor rows of the sheets that changed.
+
+    Dependencies
+    ------------
+    a ConductorV2 (or a stand-in with smart, log, load_conductor, generate_conductor_dict, ss_post, flush_writes, columnid_WEBHOOK_ID and focused_run)
+
+    Attributes
+    __________
+    conductor: ConductorV2
+    callback_url: str
+        public url Smartsheet posts the callbacks to (it has to reach host:port)
+    host, port:
+        where the local http server listens
+    debounce_seconds: float
+        a run starts once the sheets have been quiet this long
+    max_wait_seconds: float
+        but no later than this after the first pending callback, so a sheet that keeps changing still gets runs
+
+    Methods
+    -------
+    start(register=True) ---> starts the http server (in a thread) and registers/enables the webhooks
+    register_webhooks() ---> creates or re-enables one webhook per SOURCE sheet and posts its id to the WEBHOOK_ID column of the rows using that sheet
+    signed(payload, body, signature) ---> checks a callback's Smartsheet-Hmac-SHA256 header against its webhook's sharedSecret, unsigned callbacks are answered 403
+    handle_callback(payload) ---> queues the callback's sheet for the next debounced run
+    run_pending() ---> runs focused_run on the rows of the queued sheets whose version actually moved
+    stop() ---> stops the server and any pending run
+    """
+
+    def __init__(self, conductor, callback_url, host="0.0.0.0", port=8080, debounce_seconds=10, max_wait_seconds=60):
+        self.conductor = conductor
+        self.callback_url = callback_url
+        self.host = host
+        self.port = port
+        self.debounce_seconds = debounce_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.log = conductor.log
+        self.sheet_rows = {}
+        self.sheet_versions = {}
+        self.shared_secrets = {}
+        self.pending_sheets = set()
+        self.first_pending = None
+        self.timer = None
+        self.lock = threading.Lock()
+        self.run_lock = threading.Lock()
+        self.server = None
+
+    def map_rows(self):
+        '''groups the Conductor rows by SOURCE sheet id'''
+        self.sheet_rows = {}
+        for row in self.conductor.generate_conductor_dict():
+            self.sheet_rows.setdefault(str(row.get("SOURCE_sheet_id")), []).append(row)
+        return self.sheet_rows
+
+    def load_secret(self, webhook_id):
+        '''the sharedSecret Smartsheet generated for the webhook (it signs every callback w/ it)'''
+        webhook = api_call("get_webhook", self.conductor.smart.Webhooks.get_webhook, int(webhook_id)).to_dict()
+        self.shared_secrets[str(webhook.get("id"))] = webhook.get("sharedSecret")
+        return webhook
+
+    def load_secrets(self):
+        '''secrets of the webhooks already in the WEBHOOK_ID column, for start(register=False)'''
+        for webhook_id in {str(row.get("WEBHOOK_ID")) for rows in self.sheet_rows.values() for row in rows if row.get("WEBHOOK_ID") not in [None, ""]}:
+            try:
+                self.load_secret(int(float(webhook_id)))
+            except:
+                self.log.log(f"could not load the secret of webhook {webhook_id}, its callbacks will be rejected")
+
+    def signed(self, payload, body, signature):
+        secret = self.shared_secrets.get(str(payload.get("webhookId")))
+        if not secret or not signature:
+            self.log.log(f"rejected an unsigned callback (webhook {payload.get('webhookId')})")
+            return False
+        expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, signature.strip().lower()):
+            self.log.log(f"rejected a callback w/ a bad signature (webhook {payload.get('webhookId')})")
+            return False
+        return True
+
+    def register_webhooks(self):
+        smart = self.conductor.smart
+        for sheet_id, rows in self.map_rows().items():
+            webhook_ids = [row.get("WEBHOOK_ID") for row in rows if row.get("WEBHOOK_ID") not in [None, ""]]
+            webhook_id = None
+            if webhook_ids:
+                try:
+                    # enabling an existing webhook (re)runs the verification challenge against callback_url
+                    webhook_id = int(float(webhook_ids[0]))
+                    self.load_secret(webhook_id)
+                    api_call("update_webhook", smart.Webhooks.update_webhook, webhook_id, smart.models.Webhook({'enabled':True}))
+                except:
+                    self.log.log(f"webhook {webhook_ids[0]} for sheet {sheet_id} could not be enabled, creating a new one")
+                    webhook_id = None
+            if webhook_id == None:
+                try:
+                    created = api_call("create_webhook", smart.Webhooks.create_webhook, smart.models.Webhook({
+                        'name': f'ConductorV2 source {sheet_id}',
+                        'callbackUrl': self.callback_url,
+                        'scope': 'sheet',
+                        'scopeObjectId': int(sheet_id),
+                        'events': ['*.*'],
+                        'version': 1
+                    })).to_dict().get("result")
+                    webhook_id = created.get("id")
+                    self.shared_secrets[str(webhook_id)] = created.get("sharedSecret")
+                    api_call("update_webhook", smart.Webhooks.update_webhook, webhook_id, smart.models.Webhook({'enabled':True}))
+                except:
+                    self.log.log(f"failed to register a webhook for sheet {sheet_id}")
+                    continue
+            for row in rows:
+                if str(row.get("WEBHOOK_ID")) != str(webhook_id):
+                    self.conductor.ss_post(self.conductor.columnid_WEBHOOK_ID, "WEBHOOK_ID", row.get("CONDUCTOR_rowid"), str(webhook_id), with_log=False)
+            self.log.log(f"webhook {webhook_id} watching sheet {sheet_id} for {len(rows)} row(s)")
+        self.conductor.flush_writes("webhook")
+
+    def handle_callback(self, payload):
+        '''only row/cell/column events count, a callback about comments/attachments or a status change does not change any dropdown'''
+        events = [event for event in payload.get("events") or [] if event.get("objectType") in ["row", "cell", "column", "sheet"]]
+        if not events:
+            return
+        sheet_id = str(payload.get("scopeObjectId"))
+        self.log.log(f"callback for sheet {sheet_id} ({len(events)} events)")
+        with self.lock:
+            now = time.time()
+            if not self.pending_sheets:
+                self.first_pending = now
+            self.pending_sheets.add(sheet_id)
+            if self.timer != None:
+                if now - self.first_pending >= self.max_wait_seconds:
+                    # waited long enough, let the running timer fire instead of pushing it back again
+                    return
+                self.timer.cancel()
+            self.timer = threading.Timer(self.debounce_seconds, self.run_pending)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def sheet_changed(self, sheet_id):
+        '''compares the sheet version with the one seen at the last run, so duplicate or stale callbacks dont trigger a run'''
+        try:
+            version = api_call("get_sheet_version", self.conductor.smart.Sheets.get_sheet_version, int(sheet_id)).to_dict().get("version")
+        except:
+            return True
+        changed = self.sheet_versions.get(sheet_id) != version
+        self.sheet_versions[sheet_id] = version
+        return changed
+
+    def run_pending(self):
+        with self.lock:
+            sheet_ids = self.pending_sheets
+            self.pending_sheets = set()
+            self.timer = None
+        with self.run_lock:
+            changed_sheet_ids = [sheet_id for sheet_id in sheet_ids if self.sheet_changed(sheet_id)]
+            rowids = [row.get("CONDUCTOR_rowid") for sheet_id in changed_sheet_ids for row in self.sheet_rows.get(sheet_id, [])]
+            if not rowids:
+                return
+            self.log.log(f"running {len(rowids)} row(s) for changed sheet(s) {', '.join(changed_sheet_ids)}")
+            try:
+                self.conductor.load_conductor()
+                self.conductor.focused_run(rowids)
+                self.map_rows()
+            except:
+                self.log.log("focused run from webhook failed")
+
+    def start(self, register=True):
+        handler = type("receiver_handler", (webhook_handler,), {"receiver":self})
+        self.server = ThreadingHTTPServer((self.host, self.port), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.log.log(f"webhook receiver listening on {self.host}:{self.server.server_port}")
+        if register:
+            self.register_webhooks()
+        else:
+            self.map_rows()
+            self.load_secrets()
+
+    def stop(self):
+        with self.lock:
+            if self.timer != None:
+                self.timer.cancel()
+                self.timer = None
+        if self.server != None:
+            self.server.shutdown()
+            self.server.server_close()
+
+if __name__ == "__main__":
+    from conductorv2_wlogger import ConductorV2, master_token
+    config = {'stoken':master_token(), 'conductor_sheet_id': 7237912061339524}
+    receiver = webhook_receiver(ConductorV2(config), callback_url=os.environ.get("CONDUCTOR_WEBHOOK_URL"), port=int(os.environ.get("CONDUCTOR_WEBHOOK_PORT", 8080)))
+    receiver.start()
+    while True:
+        time.sleep(60)